@@ -1,22 +1,49 @@
 import streamlit as st
-import google.generativeai as genai
+import importlib
 import tempfile
 import os
 import time
 import math
 import shutil
 import subprocess
-import yt_dlp
-import markdown
 import json
 from fpdf import FPDF
-from io import BytesIO
-from moviepy.editor import VideoFileClip, AudioFileClip
-import imageio_ffmpeg
-from youtube_transcript_api import YouTubeTranscriptApi
+from io import BytesIO, StringIO
 from urllib.parse import urlparse, parse_qs
 import re 
-import graphviz
+import random
+import itertools
+import bisect
+import queue
+import hashlib
+import threading
+import contextlib
+import contextvars
+import functools
+import uuid
+import cProfile
+import pstats
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import media_probe
+import gemini_client
+import session_store
+
+# --- LAZY IMPORTS ---
+# Streamlit re-runs this file on every click. The Gemini SDK, yt-dlp and the transcript API
+# add over a second to a cold start and are only needed once a lecture is processed,
+# so they are imported on first attribute access instead.
+class LazyModule:
+    def __init__(self, name): self._name = name; self._module = None
+    def __getattr__(self, attr):
+        if self._module is None: self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# LECTUREPRO_GENAI_MODULE swaps in a stand-in with the same surface (benchmarks, load tests).
+genai = LazyModule(os.environ.get("LECTUREPRO_GENAI_MODULE", "google.generativeai"))
+yt_dlp = LazyModule("yt_dlp")
+youtube_transcript_api = LazyModule("youtube_transcript_api")
+graphviz = LazyModule("graphviz")
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -28,24 +55,180 @@ st.set_page_config(
 
 # --- SESSION STATE SETUP ---
 if "page" not in st.session_state: st.session_state["page"] = "landing"
-if "master_notes" not in st.session_state: st.session_state["master_notes"] = ""
-if "messages" not in st.session_state: st.session_state["messages"] = []
-if "quiz_data" not in st.session_state: st.session_state["quiz_data"] = None
-if "mindmap_code" not in st.session_state: st.session_state["mindmap_code"] = None
-
-# --- AUTO-SETUP FFmpeg ---
-def ensure_ffmpeg_exists():
-    current_folder = os.getcwd()
-    ffmpeg_local = os.path.join(current_folder, "ffmpeg.exe")
-    if not os.path.exists(ffmpeg_local):
+
+# --- FFmpeg ---
+# Looked up once per process: ffmpeg on PATH, else the binary bundled with imageio-ffmpeg
+# (used in place, no copy into the working directory).
+@st.cache_resource(show_spinner=False)
+def ffmpeg_binary():
+    found = shutil.which("ffmpeg")
+    if found: return found
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+# --- RESULT CACHE ---
+# Generated notes are stored on disk under a hash of everything that shaped them, so repeat
+# runs return instantly and a crashed job resumes from the first segment it didn't finish.
+CACHE_DIR = os.environ.get("LECTUREPRO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lecturepro_cache"))
+CACHE_MAX_BYTES = int(os.environ.get("LECTUREPRO_CACHE_MB", "256")) * 1024 * 1024
+
+def hash_file(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''): digest.update(block)
+    return digest.hexdigest()
+
+# Uploads can be 2 GB; copy them to disk in fixed blocks (hashing on the way) instead of
+# materialising a second full copy in memory with .read().
+INGEST_BLOCK_SIZE = 8 * 1024 * 1024
+
+def ingest_upload(uploaded_file, suffix, block_size=INGEST_BLOCK_SIZE):
+    digest = hashlib.sha256(); uploaded_file.seek(0)
+    with trace("ingest") as span, tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
         try:
-            ffmpeg_src = imageio_ffmpeg.get_ffmpeg_exe()
-            shutil.copy(ffmpeg_src, ffmpeg_local)
-        except Exception as e:
-            print(f"FFmpeg setup warning: {e}")
-    return ffmpeg_local
+            for block in iter(lambda: uploaded_file.read(block_size), b''): digest.update(block); tmp.write(block)
+            span["bytes"] = tmp.tell()
+        except BaseException:
+            tmp.close(); os.unlink(tmp.name); raise  # a half-written copy can be 2 GB
+    return tmp.name, digest.hexdigest()
 
-FFMPEG_PATH = ensure_ffmpeg_exists()
+def cache_key(*parts):
+    return hashlib.sha256("\x00".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+def cache_get(key):
+    path = os.path.join(CACHE_DIR, f"{key}.md")
+    try:
+        with open(path, encoding='utf-8') as f: text = f.read()
+        os.utime(path)  # mtime doubles as the LRU "last used" stamp
+        return text
+    except OSError: return None
+
+def cache_put(key, text):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = os.path.join(CACHE_DIR, f"{key}.md")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f: f.write(text)
+        os.replace(tmp_path, path)
+        evict_cache()
+    except OSError as e: print(f"Cache write warning: {e}")
+
+def evict_cache(max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR, suffix='.md'):
+    entries = []
+    for entry in os.scandir(directory):
+        if not entry.is_file() or not entry.name.endswith(suffix): continue
+        try: info = os.stat(entry.path)  # scandir leaves st_nlink at 0 on Windows
+        except OSError: continue
+        entries.append((info.st_mtime, info.st_size, info.st_nlink, entry.path))
+    total = sum(size for _, size, _, _ in entries)
+    for _, size, links, path in sorted(entries):
+        if total <= max_bytes: break
+        if links > 1: continue  # also linked into a running job's workspace (see job_workspace)
+        try: os.remove(path)
+        except OSError: pass
+        total -= size
+
+# --- TRACING ---
+# Every pipeline stage records a span (wall time, bytes moved, tokens in/out) under the job that
+# started it. Spans go to a process-wide ring shown in the admin panel and, when
+# LECTUREPRO_TRACE_FILE is set, are appended there as JSON lines (batch workers share the file).
+TRACE_FILE = os.environ.get("LECTUREPRO_TRACE_FILE")
+TRACE_JOB = contextvars.ContextVar("trace_job", default="-")
+TRACE_FILE_LOCK = threading.Lock()
+# The admin panel is only drawn for ?admin=<LECTUREPRO_ADMIN_TOKEN>; unset means no panel.
+ADMIN_TOKEN = os.environ.get("LECTUREPRO_ADMIN_TOKEN")
+# When set, every script run is profiled and the .prof files are written here.
+PROFILE_DIR = os.environ.get("LECTUREPRO_PROFILE_DIR")
+
+@st.cache_resource
+def get_trace_log(): return deque(maxlen=5000)
+
+def record_span(span):
+    get_trace_log().append(span)
+    if not TRACE_FILE: return
+    try:
+        with TRACE_FILE_LOCK, open(TRACE_FILE, "a", encoding="utf-8") as f: f.write(json.dumps(span, ensure_ascii=False) + "\n")
+    except OSError as e: print(f"Trace write warning: {e}")
+
+@contextlib.contextmanager
+def trace(stage, **fields):
+    span = {"job": TRACE_JOB.get(), "stage": stage, "call": "", "at": time.time(), "bytes": 0, "tokens_in": 0, "tokens_out": 0, **fields}
+    started = time.perf_counter()
+    try:
+        yield span; span["ok"] = True
+    except Exception as e:
+        span["ok"] = False; span["error"] = str(e)[:200]; raise
+    finally:
+        span.setdefault("ok", True)  # st.rerun()/st.stop() unwind through here and are not failures
+        span["seconds"] = round(time.perf_counter() - started, 4); record_span(span)
+
+def traced(stage, input_bytes=False):
+    # trace() for stages that are a whole function. input_bytes counts the file passed first;
+    # a bytes result (the PDF) is counted as output.
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with trace(stage) as span:
+                if input_bytes: span["bytes"] = os.path.getsize(args[0])
+                result = fn(*args, **kwargs)
+                if isinstance(result, bytes): span["bytes"] = len(result)
+                return result
+        return run
+    return wrap
+
+@contextlib.contextmanager
+def trace_job(kind, source=""):
+    token = TRACE_JOB.set(f"{kind}-{uuid.uuid4().hex[:8]}")
+    try:
+        with trace("job", call=kind, source=source) as span: yield span
+    finally: TRACE_JOB.reset(token)
+
+def submit_traced(pool, fn, *args):
+    # Pool threads start with an empty context; carry the job over so their spans group with it.
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+def count_tokens(span, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None: return
+    span["tokens_in"] = getattr(usage, "prompt_token_count", 0) or 0
+    span["tokens_out"] = getattr(usage, "candidates_token_count", 0) or 0
+
+def summarize_traces(spans):
+    totals = {}
+    for span in spans:
+        t = totals.setdefault((span["stage"], span.get("call", "")), Counter())
+        t["calls"] += 1; t["seconds"] += span["seconds"]; t["bytes"] += span["bytes"]
+        t["tokens_in"] += span["tokens_in"]; t["tokens_out"] += span["tokens_out"]; t["errors"] += not span["ok"]
+    return totals
+
+TRACE_METRICS = [("calls", "lecturepro_stage_calls_total", "Stage executions."),
+                 ("seconds", "lecturepro_stage_seconds_total", "Wall time spent in the stage."),
+                 ("bytes", "lecturepro_stage_bytes_total", "Bytes downloaded, cut, uploaded or written."),
+                 ("tokens_in", "lecturepro_stage_input_tokens_total", "Prompt tokens sent to Gemini."),
+                 ("tokens_out", "lecturepro_stage_output_tokens_total", "Tokens generated by Gemini."),
+                 ("errors", "lecturepro_stage_errors_total", "Stage executions that raised.")]
+
+def traces_to_prometheus(spans):
+    totals = summarize_traces(spans); lines = []
+    for field, metric, help_text in TRACE_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{stage="{stage}",call="{call}"}} {round(t[field], 4)}' for (stage, call), t in sorted(totals.items())]
+    return "\n".join(lines) + "\n"
+
+def traces_to_jsonl(spans): return "".join(json.dumps(span, ensure_ascii=False) + "\n" for span in spans)
+
+@st.cache_resource
+def get_last_profile(): return {}
+
+def run_profiled(fn):
+    profiler = cProfile.Profile(); profiler.enable()
+    try: fn()
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"run-{time.time_ns()}.prof"))
+        report = StringIO(); pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(30)
+        get_last_profile()["text"] = report.getvalue()
 
 # --- CUSTOM CSS DESIGN ---
 st.markdown("""
@@ -172,7 +355,14 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- LOGIC FUNCTIONS (Hidden for brevity, same as before) ---
+# The core PDF fonts use the Windows-1252 code page; mapping through its bytes keeps bullets,
+# dashes and curly quotes as real glyphs instead of '?'.
+PDF_BULLET = chr(149)
+
+def to_pdf_text(text): return text.encode('windows-1252', 'replace').decode('latin-1')
+
 class ModernPDF(FPDF):
+    def __init__(self, *args, **kwargs): super().__init__(*args, **kwargs); self.word_widths = {}
     def header(self):
         self.set_font('Helvetica', 'B', 20); self.set_text_color(44, 62, 80); self.cell(0, 10, 'Lecture Notes', 0, 1, 'L')
         self.set_font('Helvetica', 'I', 10); self.set_text_color(127, 140, 141); self.cell(0, 10, 'Generated by LecturePro', 0, 0, 'R')
@@ -181,39 +371,116 @@ class ModernPDF(FPDF):
         self.set_y(-15); self.set_font('Helvetica', 'I', 8); self.set_text_color(150, 150, 150); self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
     def chapter_title(self, title):
         self.set_font('Helvetica', 'B', 14); self.set_text_color(255, 255, 255); self.set_fill_color(44, 62, 80)
-        clean_title = title.replace('#', '').strip().encode('windows-1252', 'replace').decode('windows-1252')
+        clean_title = to_pdf_text(title.replace('#', '').strip())
         self.cell(0, 10, f"  {clean_title}", 0, 1, 'L', 1); self.ln(5)
     def chapter_body(self, body):
-        self.set_font('Helvetica', '', 11); self.set_text_color(20, 20, 20)
-        for line in body.split('\n'):
+        # Lines are broken here from word widths measured once per document, and each line goes
+        # out as one cell() per plain/bold run; multi_cell and write re-measure every character.
+        self.set_text_color(20, 20, 20)
+        space = self.word_width(False, ' '); widths = self.word_widths
+        for line in to_pdf_text(body).split('\n'):
             line = line.strip()
             if not line: self.ln(2); continue
-            safe_line = line.replace('•', chr(149)).replace('—', '-')
-            if '**' in safe_line:
-                parts = safe_line.split('**')
-                for i, part in enumerate(parts):
-                    if i % 2 == 0: self.set_font('Helvetica', '', 11)
-                    else: self.set_font('Helvetica', 'B', 11)
-                    self.write(6, part.encode('windows-1252', 'replace').decode('windows-1252'))
-                self.ln(6)
-            else:
-                self.set_font('Helvetica', '', 11)
-                if safe_line.startswith(chr(149)) or safe_line.startswith('-'): self.set_x(15)
-                else: self.set_x(10)
-                self.multi_cell(0, 6, safe_line.encode('windows-1252', 'replace').decode('windows-1252'))
+            left = 15 if line[0] in (PDF_BULLET, '-') else 10; max_width = self.w - self.r_margin - left - 2 * self.c_margin
+            if '**' in line:
+                # (bold, word, space before it); "**key**s" stays one visual word.
+                runs = line.split('**')
+                words = [(i % 2 == 1, word, n > 0 or run[:1].isspace() or (i > 0 and runs[i - 1][-1:].isspace()))
+                         for i, run in enumerate(runs) for n, word in enumerate(run.split())]
+                self.put_words(words, left, max_width); continue
+            # Plain lines: running widths (each word plus the space after it) and a bisect per line.
+            words = line.split()
+            ends = list(itertools.accumulate([(widths.get((False, w)) or self.word_width(False, w)) + space for w in words]))
+            start = 0; self.set_font('Helvetica', '', 11)
+            while start < len(words):
+                base = ends[start - 1] if start else 0
+                stop = bisect.bisect_right(ends, base + max_width + space, lo=start)
+                if stop == start: self.put_words([(False, w, True) for w in words[start:]], left, max_width); break  # overlong word
+                self.set_x(left); self.cell(ends[stop - 1] - base - space, 6, ' '.join(words[start:stop])); self.ln(6)
+                start = stop
+        self.set_font('Helvetica', '', 11)
         self.ln(4)
+    def word_width(self, bold, word):
+        width = self.word_widths.get((bold, word))
+        if width is None:
+            self.set_font('Helvetica', 'B' if bold else '', 11); width = self.word_widths[(bold, word)] = self.get_string_width(word)
+            self.set_font('Helvetica', '', 11)
+        return width
+    def put_words(self, words, left, max_width):
+        space = self.word_width(False, ' '); line, used = [], 0
+        for bold, word, spaced in words:
+            width = self.word_width(bold, word); gap = space if line and spaced else 0
+            if line and used + gap + width > max_width: self.put_line(line, left); line, used, gap = [], 0, 0
+            if width > max_width:  # a single word wider than the line (a URL) is hard-split
+                piece = ''
+                for ch in word:
+                    if piece and self.word_width(bold, piece + ch) > max_width: self.put_line([(bold, piece, 0, self.word_width(bold, piece))], left); piece = ''
+                    piece += ch
+                word, width = piece, self.word_width(bold, piece)
+            line.append((bold, word, gap, width)); used += gap + width
+        if line: self.put_line(line, left)
+    def put_line(self, line, left):
+        self.set_x(left)
+        for bold, run in itertools.groupby(line, key=lambda item: item[0]):
+            run = list(run)
+            self.set_font('Helvetica', 'B' if bold else '', 11)
+            self.cell(sum(gap + width for _, _, gap, width in run), 6, ''.join((' ' if gap else '') + word for _, word, gap, _ in run))
+        self.ln(6)
 
+@traced("pdf")
 def convert_markdown_to_pdf(markdown_text):
     pdf = ModernPDF(); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=15)
-    current_body = ""; clean_text = markdown_text.replace('📼', '').replace('📄', '').replace('?', '')
+    current_body = []; clean_text = markdown_text.replace('📼', '').replace('📄', '').replace('?', '')
     for line in clean_text.split('\n'):
         if line.startswith('#'):
-            if current_body: pdf.chapter_body(current_body); current_body = ""
+            if current_body: pdf.chapter_body('\n'.join(current_body)); current_body = []
             pdf.chapter_title(line)
-        else: current_body += line + "\n"
-    if current_body: pdf.chapter_body(current_body)
+        else: current_body.append(line)
+    if current_body: pdf.chapter_body('\n'.join(current_body))
     return pdf.output(dest='S').encode('latin-1', 'replace')
 
+def notes_digest(markdown_text): return hashlib.sha256(markdown_text.encode('utf-8')).hexdigest()
+
+# Built only when "Download PDF" is clicked (deferred download data) and kept per notes hash,
+# so chat messages and quiz clicks no longer rebuild the PDF on every rerun. The notes are
+# only read from the session store when it has to be built.
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_notes_pdf(notes_hash, _load_notes): return convert_markdown_to_pdf(_load_notes())
+
+# --- GEMINI ---
+# All model calls go through one scheduler per process (gemini_client): shared model instances,
+# per-key request/token buckets, round-robin turns between sessions and 429-aware retries.
+# LECTUREPRO_GEMINI_RPM / _TPM override the built-in per-model quotas (e.g. for the free tier).
+GEMINI_RPM = int(os.environ.get("LECTUREPRO_GEMINI_RPM", "0")) or None
+GEMINI_TPM = int(os.environ.get("LECTUREPRO_GEMINI_TPM", "0")) or None
+
+@st.cache_resource(show_spinner=False)
+def get_gemini(): return gemini_client.GeminiScheduler(genai, GEMINI_RPM, GEMINI_TPM)
+
+def gemini_model(api_key, model_name): return get_gemini().model(api_key, model_name)
+
+def split_gemini_quota(processes):
+    # Pool initializer for batch.py: worker processes share one key's quota.
+    get_gemini().share = max(1, processes)
+
+# --- STREAMING ---
+# Responses are streamed so the page fills in as tokens arrive; time-to-first-token goes into
+# the call's trace span next to its total time.
+def stream_generate(model, contents, placeholder=None, label=""):
+    started = time.perf_counter(); first_token = None; parts = []
+    with trace("generate", call=label, model=model.model_name) as span:
+        for chunk in model.generate_content(contents, stream=True):
+            count_tokens(span, chunk)  # the last chunk carries the totals
+            try: text = chunk.text
+            except ValueError: continue  # chunks that only carry finish/safety metadata
+            if first_token is None: first_token = time.perf_counter() - started
+            parts.append(text)
+            if placeholder is not None: placeholder.markdown("".join(parts) + " ▌")
+        span["ttft_s"] = first_token and round(first_token, 4)
+    text = "".join(parts)
+    if placeholder is not None: placeholder.markdown(text)
+    return text
+
 def get_system_prompt(detail_level, context_type, part_info="", custom_focus=""):
     base = f"You are an expert Academic Tutor. {part_info} "
     if custom_focus: base += f"\nIMPORTANT: User requested: '{custom_focus}'. PRIORITIZE THIS.\n"
@@ -226,32 +493,216 @@ def get_system_prompt(detail_level, context_type, part_info="", custom_focus="")
     elif "Exhaustive" in detail_level: return base + f"Create EXHAUSTIVE NOTES of this {context_type}."
     else: return base + f"Create STANDARD STUDY NOTES of this {context_type}."
 
+# --- MIND MAP ---
+# The map is read straight off the notes' heading and bullet tree, so it is there as soon as the
+# notes are and can't come back malformed. Graphviz renders it to SVG on the server, cached per
+# notes hash; only the optional enhanced map asks the LLM.
+MINDMAP_COLORS = ("#FFD700", "#D1C4E9", "#B3E5FC", "#C8E6C9")  # root, L1, L2, L3
+MINDMAP_LABEL_WORDS = 6
+MINDMAP_MAX_CHILDREN = 8
+MINDMAP_MAX_NODES = 120
+DOT_HEADER = 'digraph G { graph [rankdir=LR, splines=ortho]; node [shape=box, style="filled", fontname="Arial"]; edge [color="#555555"];'
+
+def mindmap_label(text):
+    text = re.sub(r"\[(?:\d+:)?\d+:\d{2}\]", "", text)  # transcript stamps
+    term = re.match(r"\s*\*\*(.+?)\*\*", text)  # "- **Term:** definition" is labelled by its term
+    if term: text = term.group(1)
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)|[*_`#>]", lambda m: m.group(1) or "", text).strip(" :-–")
+    words = text.split()
+    return " ".join(words[:MINDMAP_LABEL_WORDS]) + (" …" if len(words) > MINDMAP_LABEL_WORDS else "")
+
+def notes_outline(notes_text):
+    # [(parent, depth, label)] in document order, node 0 being the root. A heading nests under
+    # the closest heading with fewer '#', so notes that start at '##' still begin at L1; bullets
+    # hang below their heading by indent. Anything deeper than L3 is left out, and crowded
+    # branches end in a "+N more" node.
+    root, nodes, stack, children, hidden = "Lecture Notes", [], [0], Counter(), Counter()
+    headings, heading_depth, in_tldr, in_code = [], 0, False, False  # headings: '#' counts of the open ones
+    for line in notes_text.split("\n"):
+        if line.lstrip().startswith("```"): in_code = not in_code
+        if in_code: continue
+        heading = re.match(r"(#{1,6}) +(.*)", line)
+        bullet = re.match(r"( *)(?:[-*•+]|\d+[.)]) +(.*)", line.replace("\t", "    "))
+        if heading:
+            in_tldr = "TL;DR" in heading.group(2)
+            if in_tldr: continue
+            while headings and headings[-1] >= len(heading.group(1)): headings.pop()
+            headings.append(len(heading.group(1))); depth = heading_depth = len(headings)
+        elif bullet and not in_tldr: depth = heading_depth + 1 + len(bullet.group(1)) // 2
+        else:
+            topic = re.search(r"Core Topic:\**\s*(.+)", line) if in_tldr and root == "Lecture Notes" else None
+            if topic: root = mindmap_label(topic.group(1))
+            continue
+        depth = min(depth, len(stack))
+        del stack[depth:]
+        parent = stack[-1]; label = mindmap_label((heading or bullet).group(2))
+        if depth >= len(MINDMAP_COLORS) or parent is None or not label: stack.append(None); continue
+        if children[parent] >= MINDMAP_MAX_CHILDREN or len(nodes) >= MINDMAP_MAX_NODES:
+            hidden[parent] += 1; stack.append(None); continue
+        nodes.append((parent, depth, label)); children[parent] += 1; stack.append(len(nodes))
+    nodes += [(parent, nodes[parent - 1][1] + 1 if parent else 1, f"+{count} more") for parent, count in hidden.items()]
+    return root, nodes
+
+def dot_quote(text): return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def dot_balanced(dot):
+    # Without the dot binary nothing here can parse a graph; at least every quote and brace
+    # must close, which is how truncated or chatty replies usually break.
+    open_brackets, quoted, escaped = [], False, False
+    for ch in dot:
+        if quoted:
+            if escaped: escaped = False
+            elif ch == '\\': escaped = True
+            elif ch == '"': quoted = False
+        elif ch == '"': quoted = True
+        elif ch in '{[': open_brackets.append(ch)
+        elif ch in '}]' and (not open_brackets or open_brackets.pop() != '{['['}]'.index(ch)]): return False
+    return not open_brackets and not quoted
+
+def mindmap_dot(notes_text):
+    root, nodes = notes_outline(notes_text)
+    lines = [DOT_HEADER, f'n0 [label={dot_quote(root)}, fillcolor="{MINDMAP_COLORS[0]}"];']
+    lines += [f'n{i} [label={dot_quote(label)}, fillcolor="{MINDMAP_COLORS[min(depth, 3)]}"]; n{parent} -> n{i};' for i, (parent, depth, label) in enumerate(nodes, 1)]
+    return "\n".join(lines + ["}"])
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def render_dot_svg(dot_hash, _dot):
+    # SVG from Graphviz's `dot` (packages.txt), or None without it; callers then let the browser
+    # lay the graph out. Invalid DOT raises graphviz.CalledProcessError.
+    try: return graphviz.Source(_dot).pipe(format="svg", encoding="utf-8")
+    except graphviz.ExecutableNotFound: return None
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def local_mindmap(notes_hash, _load_notes):
+    dot = mindmap_dot(_load_notes())
+    return dot, render_dot_svg(notes_digest(dot), dot)
+
+def draw_mindmap(dot, svg):
+    if svg: st.image(svg, width="stretch")
+    else: st.graphviz_chart(dot)
+
+# --- BACKGROUND ARTIFACTS ---
+# The quiz starts in a background pool as soon as notes are shown, and the enhanced mind map
+# when asked for, keyed by the notes hash so the tabs are usually ready when opened. Both read
+# the whole document by section instead of its first 15k characters.
+MAX_BACKGROUND_WORKERS = 4
+MAX_BACKGROUND_JOBS = 32
+QUIZ_QUESTIONS = 5
+QUIZ_GROUP_TOKENS = 12000
+MINDMAP_TOKENS = 12000
+
+def with_backoff(fn, attempts=4, base_delay=1.0, max_delay=30.0):
+    # Exponential backoff with full jitter, so callers that failed together don't retry together.
+    for attempt in range(attempts):
+        try: return fn()
+        except gemini_client.GeminiUnavailable: raise  # the scheduler already retried it
+        except Exception:
+            if attempt == attempts - 1: raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+def quiz_questions(model, notes_text, count):
+    prompt = f"Create {count} multiple choice questions. OUTPUT ONLY RAW JSON. Structure: [ {{\"question\": \"?\", \"options\": [\"A) x\", \"B) y\"], \"answer\": \"B) y\"}} ]. NOTES: {notes_text}"
+    with trace("generate", call="quiz", model=model.model_name) as span:
+        response = model.generate_content(prompt); count_tokens(span, response)
+    text = response.text; start = text.find('['); end = text.rfind(']') + 1
+    if start == -1 or end == 0: raise ValueError("the reply held no JSON list")
+    return json.loads(text[start:end])
+
 def generate_quiz(notes_text, api_key):
-    genai.configure(api_key=api_key); model = genai.GenerativeModel(model_name="gemini-2.5-flash")
-    prompt = f"Create 5 multiple choice questions. OUTPUT ONLY RAW JSON. Structure: [ {{\"question\": \"?\", \"options\": [\"A) x\", \"B) y\"], \"answer\": \"B) y\"}} ]. NOTES: {notes_text[:15000]}"
-    for attempt in range(3):
-        try:
-            response = model.generate_content(prompt); text = response.text
-            start = text.find('['); end = text.rfind(']') + 1
-            if start != -1 and end != -1: return json.loads(text[start:end])
-        except Exception: time.sleep(4); continue
-    st.error("Quiz failed."); return None
+    # QUIZ_QUESTIONS spread evenly over the token-budgeted groups of sections (evenly spaced
+    # groups when there are more groups than questions), asked in parallel.
+    key = cache_key("quiz", notes_digest(notes_text), QUIZ_QUESTIONS)
+    cached = cache_get(key)
+    if cached is not None: return json.loads(cached)[:QUIZ_QUESTIONS]  # entries from before the cap
+    model = gemini_model(api_key, "gemini-2.5-flash")
+    groups = group_by_token_budget(session_store.split_sections(notes_text), QUIZ_GROUP_TOKENS)
+    shares = Counter(i * len(groups) // QUIZ_QUESTIONS for i in range(QUIZ_QUESTIONS))
+    ask = lambda index: with_backoff(lambda: quiz_questions(model, "\n\n".join(groups[index]), shares[index]))
+    with ThreadPoolExecutor(max_workers=min(MAX_BACKGROUND_WORKERS, len(shares))) as pool:
+        quiz = [question for questions in pool.map(ask, sorted(shares)) for question in questions][:QUIZ_QUESTIONS]
+    cache_put(key, json.dumps(quiz))
+    return quiz
+
+def mindmap_digest(notes_text, budget=MINDMAP_TOKENS):
+    # Every section keeps its heading and an equal share of the budget, so the map spans the
+    # whole lecture.
+    sections = session_store.split_sections(notes_text)
+    share = max(200, budget * 4 // max(len(sections), 1))
+    return "\n\n".join(section[:share] for section in sections)
 
 def generate_mindmap(notes_text, api_key):
-    genai.configure(api_key=api_key); model = genai.GenerativeModel(model_name="gemini-2.5-flash")
+    key = cache_key("mindmap", notes_digest(notes_text))
+    cached = cache_get(key)
+    if cached is not None: return cached
+    model = gemini_model(api_key, "gemini-2.5-flash")
     prompt = f"""
     Create Graphviz DOT code.
     CRITICAL:
-    1. Start: digraph G {{ graph [rankdir=LR, splines=ortho]; node [shape=box, style="filled", fontname="Arial"]; edge [color="#555555"];
-    2. COLORS: Root="#FFD700", L1="#D1C4E9", L2="#B3E5FC", L3="#C8E6C9".
+    1. Start: {DOT_HEADER}
+    2. COLORS: Root="{MINDMAP_COLORS[0]}", L1="{MINDMAP_COLORS[1]}", L2="{MINDMAP_COLORS[2]}", L3="{MINDMAP_COLORS[3]}".
     3. Max 6 words/label.
     4. OUTPUT ONLY RAW CODE inside dot tags.
-    NOTES: {notes_text[:15000]}
+    NOTES: {mindmap_digest(notes_text)}
     """
-    try:
-        response = model.generate_content(prompt); text = response.text
-        return text.replace("```dot", "").replace("```", "").replace("graphviz", "").strip()
-    except Exception as e: st.error(f"Mind Map Error: {e}"); return None
+    def ask():
+        with trace("generate", call="mindmap", model=model.model_name) as span:
+            response = model.generate_content(prompt); count_tokens(span, response)
+        # The graph is cut out of whatever surrounds it, and must render, or it is asked again.
+        # Without `dot` it only has to be balanced, and is not cached, so it is checked properly
+        # once `dot` is there.
+        graph = re.search(r"(?:strict\s+)?(?:di)?graph\b[^{]*\{.*\}", response.text, re.S)
+        if not graph: raise ValueError("the reply held no DOT graph")
+        rendered = render_dot_svg(notes_digest(graph.group(0)), graph.group(0)) is not None
+        if not rendered and not dot_balanced(graph.group(0)): raise ValueError("the reply held a malformed DOT graph")
+        return graph.group(0), rendered
+    code, rendered = with_backoff(ask)
+    if rendered: cache_put(key, code)
+    return code
+
+ARTIFACT_BUILDERS = {"quiz": generate_quiz, "mindmap": generate_mindmap}
+
+@st.cache_resource
+def get_background_pool(): return ThreadPoolExecutor(max_workers=MAX_BACKGROUND_WORKERS, thread_name_prefix="lecturepro-bg")
+
+@st.cache_resource
+def get_artifact_jobs(): return OrderedDict(), threading.Lock()
+
+def run_artifact(kind, notes_text, api_key):
+    with trace_job(kind): return ARTIFACT_BUILDERS[kind](notes_text, api_key)
+
+def start_artifact(kind, notes_hash, load_notes, api_key, retry=False):
+    # Idempotent per (kind, notes hash); a failed job is only resubmitted when asked to retry.
+    # The notes are only read when a job is actually submitted.
+    jobs, lock = get_artifact_jobs(); key = (kind, notes_hash)
+    with lock:
+        job = jobs.get(key)
+        if job is None or (retry and job.done() and job.exception() is not None):
+            job = jobs[key] = submit_traced(get_background_pool(), run_artifact, kind, load_notes(), api_key)
+        jobs.move_to_end(key)
+        while len(jobs) > MAX_BACKGROUND_JOBS: jobs.popitem(last=False)
+    return job
+
+def artifact_view(kind, notes_hash, load_notes, api_key, label, auto=True):
+    # Returns the finished artifact, or draws its state (pending/failed) and returns None.
+    # auto=False waits for the button before starting the job. Finished ones are kept with the session.
+    stored = get_session_store().artifact(current_session(), kind, notes_hash)
+    if stored is not None: return stored
+    if not api_key: st.info("Add your API key to generate this."); return None
+    if not auto and (kind, notes_hash) not in get_artifact_jobs()[0]:
+        if st.button(label): start_artifact(kind, notes_hash, load_notes, api_key); st.rerun()
+        return None
+    job = start_artifact(kind, notes_hash, load_notes, api_key)
+    if job.done() and job.exception() is None:
+        get_session_store().put_artifact(current_session(), kind, notes_hash, job.result()); return job.result()
+    if job.done():
+        st.error(f"{label} failed: {job.exception()}")
+        if st.button("Retry", key=f"retry_{kind}"): start_artifact(kind, notes_hash, load_notes, api_key, retry=True); st.rerun()
+        return None
+    st.caption("Being prepared in the background...")
+    if st.button(label):
+        with st.spinner("Almost there..."): wait([job])
+        st.rerun()
+    return None
 
 def get_video_id(url):
     try:
@@ -261,103 +712,565 @@ def get_video_id(url):
             if query.path == '/watch': return parse_qs(query.query)['v'][0]
     except: return None
 
+@traced("transcript")
 def get_transcript(video_id):
-    try:
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        return " ".join([line['text'] for line in transcript_list])
-    except: return None
+    # [(start_seconds, text), ...] with the caption timing kept, or None without a transcript.
+    try: return [(snippet.start, snippet.text) for snippet in youtube_transcript_api.YouTubeTranscriptApi().fetch(video_id)]
+    except Exception: return None
 
-def download_audio_from_youtube(url):
-    try:
-        ffmpeg_loc = "ffmpeg" if shutil.which("ffmpeg") else os.path.abspath("ffmpeg.exe")
-        ydl_opts = {'format': 'bestaudio[ext=m4a]/bestaudio', 'outtmpl': 'temp_yt_audio.%(ext)s', 'ffmpeg_location': ffmpeg_loc, 'quiet': True}
+# --- YOUTUBE DOWNLOADS ---
+# Every download runs in its job's own workspace and is then linked into a cache shared by all
+# sessions, keyed by video id and trimmed by size, so a popular lecture is fetched once.
+DOWNLOAD_DIR = os.environ.get("LECTUREPRO_DOWNLOAD_DIR", os.path.join(tempfile.gettempdir(), "lecturepro_downloads"))
+DOWNLOAD_MAX_BYTES = int(os.environ.get("LECTUREPRO_DOWNLOAD_CACHE_MB", "4096")) * 1024 * 1024
+# Fragments of DASH/HLS formats are fetched in parallel.
+FRAGMENT_WORKERS = int(os.environ.get("LECTUREPRO_FRAGMENT_WORKERS", "4"))
+YOUTUBE_FORMATS = {"audio": 'bestaudio[ext=m4a]/bestaudio', "video": 'best[ext=mp4][height<=720]'}
+# Workspaces left behind by a killed job are removed after this long.
+STALE_WORKSPACE_SEC = 24 * 3600
+
+DOWNLOAD_LOCK_STRIPES = 64
+
+@st.cache_resource
+def get_download_locks(): return [threading.Lock() for _ in range(DOWNLOAD_LOCK_STRIPES)]
+
+def download_lock(key):
+    # Sessions asking for the same video wait for the first download instead of repeating it.
+    # A fixed set of locks, so memory doesn't grow with every video ever asked for; two videos
+    # that share a stripe only download one after the other.
+    return get_download_locks()[hash(key) % DOWNLOAD_LOCK_STRIPES]
+
+def find_cached_download(prefix):
+    if not os.path.isdir(DOWNLOAD_DIR): return None
+    for entry in os.scandir(DOWNLOAD_DIR):
+        if entry.is_file() and entry.name.startswith(prefix + "."):
+            os.utime(entry.path); return entry.path  # mtime is the LRU clock
+    return None
+
+@contextlib.contextmanager
+def job_workspace():
+    # A directory of the job's own next to the cache. Downloads are hard-linked into it, and a
+    # cache entry with a second link is skipped by eviction, so it stays whole (in any process)
+    # until the job is done.
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    cutoff = time.time() - STALE_WORKSPACE_SEC
+    for entry in os.scandir(DOWNLOAD_DIR):
+        if entry.is_dir() and entry.name.startswith("job_") and entry.stat().st_mtime < cutoff: shutil.rmtree(entry.path, ignore_errors=True)
+    workspace = tempfile.mkdtemp(prefix="job_", dir=DOWNLOAD_DIR)
+    try: yield workspace
+    finally: shutil.rmtree(workspace, ignore_errors=True)
+
+def fetch_youtube(url, kind, workspace):
+    # Returns a path inside `workspace` (from job_workspace), linked to the shared cache entry.
+    prefix = f"{get_video_id(url) or cache_key(url)}.{kind}"
+    with download_lock(prefix), trace("download", call=kind, source=url) as span:
+        cached = find_cached_download(prefix)
+        if cached:
+            path = os.path.join(workspace, os.path.basename(cached))
+            try: os.link(cached, path); span["cached"] = True; span["bytes"] = os.path.getsize(path); return path
+            except FileNotFoundError: pass  # evicted by another process in between; fetch it again
+        ydl_opts = {'format': YOUTUBE_FORMATS[kind], 'outtmpl': os.path.join(workspace, f'{prefix}.%(ext)s'), 'ffmpeg_location': ffmpeg_binary(),
+                    'concurrent_fragment_downloads': FRAGMENT_WORKERS, 'quiet': True}
         with yt_dlp.YoutubeDL(ydl_opts) as ydl: ydl.download([url])
-        return "temp_yt_audio.m4a"
+        names = [name for name in os.listdir(workspace) if name.startswith(prefix + ".") and not name.endswith(".part")]
+        if not names: raise RuntimeError("yt-dlp finished without writing a file")
+        path = os.path.join(workspace, names[0])
+        try: os.link(path, os.path.join(DOWNLOAD_DIR, names[0]))
+        except FileExistsError: pass  # another process cached it first
+        span["bytes"] = os.path.getsize(path)
+    evict_cache(DOWNLOAD_MAX_BYTES, DOWNLOAD_DIR, "")
+    return path
+
+def download_audio_from_youtube(url, workspace):
+    try: return fetch_youtube(url, "audio", workspace)
     except Exception as e: st.error(f"Audio DL Error: {e}"); return None
 
-def download_video_from_youtube(url):
-    try:
-        ffmpeg_loc = "ffmpeg" if shutil.which("ffmpeg") else os.path.abspath("ffmpeg.exe")
-        ydl_opts = {'format': 'best[ext=mp4][height<=720]', 'outtmpl': 'temp_yt_vid.%(ext)s', 'ffmpeg_location': ffmpeg_loc, 'quiet': True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl: ydl.download([url])
-        return "temp_yt_vid.mp4"
+def download_video_from_youtube(url, workspace):
+    try: return fetch_youtube(url, "video", workspace)
     except Exception as e: st.error(f"Video DL Error: {e}"); return None
 
-def get_media_duration(file_path):
-    try:
-        if file_path.endswith('.m4a') or file_path.endswith('.mp3'): clip = AudioFileClip(file_path)
-        else: clip = VideoFileClip(file_path)
-        duration = clip.duration; clip.close(); return duration
-    except: return 0
-
-def cut_media_fast(input_path, output_path, start_time, end_time):
-    ffmpeg_exe = "ffmpeg" if shutil.which("ffmpeg") else os.path.abspath("ffmpeg.exe")
-    cmd = [ffmpeg_exe, "-y", "-i", input_path, "-ss", str(start_time), "-to", str(end_time), "-c", "copy", output_path]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-def run_master_editor(all_chunk_notes, api_key, detail_level, custom_focus):
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name="gemini-2.5-pro") 
-    combined_raw_text = "\n\n".join(all_chunk_notes)
-    system_prompt = f"""
+@traced("probe")
+def probe_media(file_path, file_hash=None): return media_probe.probe(file_path, ffmpeg_binary(), file_hash)
+
+# --- SEGMENTER ---
+# Segment length follows the file instead of a fixed 40 minutes: aim for uploads of about
+# SEGMENT_TARGET_MB, capped per media type, then nudge each cut into the nearest pause.
+SEGMENT_TARGET_BYTES = int(os.environ.get("LECTUREPRO_SEGMENT_TARGET_MB", "400")) * 1024 * 1024
+MAX_AUDIO_SEGMENT_SEC = 3600
+MAX_VIDEO_SEGMENT_SEC = 2400
+MIN_SEGMENT_SEC = 600
+SILENCE_SEARCH_SEC = 120
+# A keyframe this close before a requested cut counts as on it. Without the slack ffmpeg
+# compares timestamps exactly and can run on to the next keyframe, a whole GOP late.
+SEGMENT_TIME_DELTA = 0.05
+
+def plan_segment_length(duration_sec, bit_rate, is_audio):
+    max_len = MAX_AUDIO_SEGMENT_SEC if is_audio else MAX_VIDEO_SEGMENT_SEC
+    bytes_per_sec = max(bit_rate / 8, 1)
+    length = max(MIN_SEGMENT_SEC, min(max_len, SEGMENT_TARGET_BYTES / bytes_per_sec))
+    # Spread evenly so the last segment isn't a 30-second stub.
+    return duration_sec / math.ceil(duration_sec / length)
+
+@traced("silence_detect", input_bytes=True)
+def detect_silences(input_path, noise_db=-35, min_silence=0.5):
+    ffmpeg_exe = ffmpeg_binary()
+    cmd = [ffmpeg_exe, "-hide_banner", "-nostats", "-i", input_path, "-vn", "-sn", "-dn", "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"]
+    log = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace').stderr
+    starts = [float(t) for t in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(t) for t in re.findall(r"silence_end: ([\d.]+)", log)]
+    return list(zip(starts, ends))
+
+def plan_cut_points(duration_sec, segment_len, silences, keyframes=()):
+    cuts, target = [], segment_len
+    while target < duration_sec - MIN_SEGMENT_SEC / 2:
+        previous = cuts[-1] if cuts else 0
+        pauses = [(start + end) / 2 for start, end in silences if abs((start + end) / 2 - target) <= SILENCE_SEARCH_SEC]
+        pauses = [t for t in pauses if t - previous >= MIN_SEGMENT_SEC / 2]
+        cut = min(pauses, key=lambda t: abs(t - target)) if pauses else target
+        if keyframes:
+            # Video can only be cut on a keyframe; take the nearest one rather than letting
+            # ffmpeg run on to the next, which can be seconds past the pause.
+            i = bisect.bisect_left(keyframes, cut)
+            nearby = [k for k in keyframes[max(i - 1, 0):i + 1] if k - previous >= MIN_SEGMENT_SEC / 2]
+            if nearby: cut = min(nearby, key=lambda k: abs(k - cut))
+        cuts.append(cut); target = cut + segment_len
+    return cuts
+
+@traced("segment", input_bytes=True)
+def segment_media(input_path, output_dir, cut_points):
+    # One ffmpeg pass writes every segment. Stream copy means the segment muxer can only split
+    # on keyframes, so each cut lands on the first keyframe at or after the requested time
+    # (less SEGMENT_TIME_DELTA, so a cut planned on a keyframe stays on it).
+    if not cut_points: return [input_path]
+    ffmpeg_exe = ffmpeg_binary()
+    ext = os.path.splitext(input_path)[1]
+    pattern = os.path.join(output_dir, f"temp_chunk_%03d{ext}")
+    cmd = [ffmpeg_exe, "-y", "-hide_banner", "-i", input_path, "-map", "0:v:0?", "-map", "0:a:0?", "-c", "copy",
+           "-f", "segment", "-segment_times", ",".join(f"{t:.3f}" for t in cut_points), "-segment_time_delta", str(SEGMENT_TIME_DELTA),
+           "-reset_timestamps", "1", pattern]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+    if result.returncode != 0: raise RuntimeError(f"Splitting failed: {result.stderr.strip().splitlines()[-1:]}")
+    return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir) if name.startswith("temp_chunk_"))
+
+# --- MASTER EDITOR ---
+# Long lectures are merged as a tree: segment notes are packed into groups that fit
+# MERGE_TOKEN_BUDGET, the groups are merged in parallel, and the results are packed again
+# until a single document is left for the final edit.
+MERGE_TOKEN_BUDGET = int(os.environ.get("LECTUREPRO_MERGE_TOKENS", "60000"))
+MAX_MERGE_WORKERS = 4
+
+def estimate_tokens(text): return len(text) // 4 + 1
+
+def group_by_token_budget(notes, budget=MERGE_TOKEN_BUDGET):
+    groups, current, used = [], [], 0
+    for note in notes:
+        cost = estimate_tokens(note)
+        if current and used + cost > budget: groups.append(current); current, used = [], 0
+        current.append(note); used += cost
+    if current: groups.append(current)
+    # Every note is already over budget on its own: fall back to pairs so each level still halves.
+    if len(groups) == len(notes) > 1: groups = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+    return groups
+
+def merge_notes(model, notes, detail_level, custom_focus, final, placeholder=None):
+    key = cache_key("master" if final else "merge", model.model_name, detail_level, custom_focus, *notes)
+    cached = cache_get(key)
+    if cached is not None: return cached
+    combined_raw_text = "\n\n".join(notes)
+    if final:
+        system_prompt = f"""
     You are the "Master Editor". MERGE these notes into one cohesive document.
     Detail: {detail_level}. Focus: {custom_focus}.
     RAW NOTES: {combined_raw_text}
     """
+    else:
+        system_prompt = f"""
+    You are merging CONSECUTIVE PARTS of one lecture, in order. Combine them into one document.
+    Remove repetition but keep every fact, definition, formula and example. Do NOT summarise.
+    Focus: {custom_focus}.
+    RAW NOTES: {combined_raw_text}
+    """
+    text = stream_generate(model, system_prompt, placeholder, "master_edit" if final else "merge")
+    cache_put(key, text)
+    return text
+
+def run_master_editor(all_chunk_notes, api_key, detail_level, custom_focus, placeholder=None):
+    model = gemini_model(api_key, "gemini-2.5-pro")
+    level = list(all_chunk_notes)
     try:
-        response = model.generate_content(system_prompt)
-        return response.text
+        while True:
+            groups = group_by_token_budget(level)
+            if len(groups) == 1: return merge_notes(model, groups[0], detail_level, custom_focus, final=True, placeholder=placeholder)
+            # Singletons pass straight through to the next level; only real groups cost a call.
+            merge_group = lambda group: group[0] if len(group) == 1 else merge_notes(model, group, detail_level, custom_focus, final=False)
+            with ThreadPoolExecutor(max_workers=min(MAX_MERGE_WORKERS, len(groups))) as pool:
+                level = [future.result() for future in [submit_traced(pool, merge_group, group) for group in groups]]
     except Exception as e: return f"Error: {e}"
 
-def split_and_process_media(original_file_path, api_key, detail_level, custom_focus):
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name="gemini-2.5-pro") 
-    duration_sec = get_media_duration(original_file_path)
-    if duration_sec == 0: return
-    chunk_size_sec = 2400 
-    total_chunks = math.ceil(duration_sec / chunk_size_sec)
-    
-    st.info(f"Processing {total_chunks} segments...")
-    progress_bar = st.progress(0)
-    raw_notes_accumulator = [] 
-
-    for i in range(total_chunks):
-        start_time = i * chunk_size_sec
-        end_time = min((i + 1) * chunk_size_sec, duration_sec)
-        with st.status(f"Processing Part {i+1}...", expanded=True) as status:
-            ext = os.path.splitext(original_file_path)[1]
-            chunk_path = f"temp_chunk_{i}{ext}"
-            cut_media_fast(original_file_path, chunk_path, start_time, end_time)
-            try:
-                video_file = genai.upload_file(path=chunk_path)
-                while video_file.state.name == "PROCESSING": time.sleep(2); video_file = genai.get_file(video_file.name)
-                is_audio = ext.lower() in ['.mp3', '.wav', '.m4a']
-                sys_prompt = get_system_prompt("Exhaustive", "audio" if is_audio else "video", f"Part {i+1}", custom_focus)
-                response = model.generate_content([video_file, sys_prompt])
-                raw_notes_accumulator.append(response.text)
-                status.update(label="Done", state="complete")
-            except Exception as e: st.error(str(e))
-            finally: 
-                if os.path.exists(chunk_path): os.remove(chunk_path)
-        progress_bar.progress((i + 1) / total_chunks)
-
-    final_polished_notes = run_master_editor(raw_notes_accumulator, api_key, detail_level, custom_focus)
-    st.session_state["master_notes"] = final_polished_notes
+# --- LEAN MEDIA ---
+# Optional transcode before upload. Talking-head lectures carry almost nothing in the picture,
+# so mono 16 kHz speech audio (plus a frame per slide change, if asked) is all Gemini needs.
+LEAN_MEDIA_MODES = {"Original": None, "Lean: audio only": "audio", "Lean: audio + slides": "slides"}
+# Slides mode still keeps a frame this often, so a static talking head leaves keyframes to cut on.
+LEAN_FRAME_EVERY_SEC = 30
+
+@traced("lean_transcode", input_bytes=True)
+def make_lean_media(input_path, output_dir, mode):
+    ffmpeg_exe = ffmpeg_binary()
+    speech_audio = ["-ac", "1", "-ar", "16000", "-c:a", "aac", "-b:a", "32k"]
+    if mode == "audio":
+        output_path = os.path.join(output_dir, "lean.m4a")
+        cmd = [ffmpeg_exe, "-y", "-hide_banner", "-i", input_path, "-vn", *speech_audio, output_path]
+    else:
+        # Keep the first frame, every scene change and one frame per LEAN_FRAME_EVERY_SEC; every
+        # kept frame is a keyframe, so the segmenter always has one near a planned cut.
+        output_path = os.path.join(output_dir, "lean.mp4")
+        keep = f"select='eq(n,0)+gt(scene,0.3)+gte(t-prev_selected_t,{LEAN_FRAME_EVERY_SEC})'"
+        cmd = [ffmpeg_exe, "-y", "-hide_banner", "-i", input_path, "-vf", f"{keep},scale=-2:720",
+               "-fps_mode", "vfr", "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-g", "1", *speech_audio, output_path]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+    if result.returncode != 0: raise RuntimeError(f"Lean transcode failed: {result.stderr.strip().splitlines()[-1:]}")
+    return output_path
+
+def format_bytes(size): return f"{size / (1024 * 1024):.1f} MB"
+
+# Segments are cut, uploaded and summarised concurrently; most of a segment's time is spent
+# waiting on the upload/PROCESSING/generation round-trips, so a small pool hides that latency.
+MAX_SEGMENT_WORKERS = int(os.environ.get("LECTUREPRO_SEGMENT_WORKERS", "3"))
+
+def process_media_segment(model, api_key, chunk_path, index, is_audio, custom_focus, report):
+    sys_prompt = get_system_prompt("Exhaustive", "audio" if is_audio else "video", f"Part {index+1}", custom_focus)
+    key = cache_key("segment", model.model_name, hash_file(chunk_path), sys_prompt)
+    cached = cache_get(key)
+    if cached is not None:
+        report(index, f"Part {index+1}: cached"); return cached
+    report(index, f"Part {index+1}: uploading...")
+    with trace("upload", bytes=os.path.getsize(chunk_path)): video_file = get_gemini().upload_file(api_key, chunk_path)
+    with trace("processing_wait"):
+        while video_file.state.name == "PROCESSING": time.sleep(2); video_file = get_gemini().get_file(api_key, video_file.name)
+    report(index, f"Part {index+1}: writing notes...")
+    text = stream_generate(model, [video_file, sys_prompt], label="segment")
+    cache_put(key, text)
+    return text
+
+class StreamlitProgress:
+    # Draws pipeline progress with Streamlit elements, from the script thread only. Headless
+    # callers (batch.py) pass their own object with the same methods.
+    savings = None  # (original, lean) bytes of this job, stored with its notes
+    def stage(self, label): return st.spinner(label)
+    def info(self, message): st.info(message)
+    def error(self, message): st.error(message)
+    def lean_savings(self, original_size, lean_size):
+        self.savings = (original_size, lean_size)
+        st.info(f"Lean media: {format_bytes(original_size)} → {format_bytes(lean_size)} ({format_bytes(max(original_size - lean_size, 0))} saved)")
+    def start_segments(self, total, workers):
+        st.info(f"Processing {total} segments ({workers} at a time)...")
+        self.total, self.finished = total, 0
+        self.bar = st.progress(0)
+        self.statuses = [st.status(f"Part {i+1}: queued", expanded=False) for i in range(total)]
+    def segment(self, index, label, state="running"):
+        self.statuses[index].update(label=label, state=state)
+        if state != "running": self.finished += 1; self.bar.progress(self.finished / self.total)
+    def live_text(self, title):
+        st.markdown(f"#### {title}"); return st.empty()
+
+def generate_media_notes(original_file_path, api_key, detail_level, custom_focus, progress, max_workers=MAX_SEGMENT_WORKERS, media_hash=None, lean_mode=None):
+    # Whole-job hit: identical media and settings skip cutting and uploading entirely.
+    media_hash = media_hash or hash_file(original_file_path)
+    job_key = cache_key("job", media_hash, detail_level, custom_focus, lean_mode)
+    cached = cache_get(job_key)
+    if cached is not None:
+        savings = lean_mode and cache_get(cache_key("lean_savings", job_key))
+        if savings: progress.lean_savings(*json.loads(savings))
+        return cached
+    model = gemini_model(api_key, "gemini-2.5-pro")
+    work_dir = tempfile.mkdtemp(prefix="lecturepro_")
+
+    try:
+        if lean_mode:
+            with progress.stage("Shrinking media before upload..."):
+                lean_path = make_lean_media(original_file_path, work_dir, lean_mode)
+            savings = (os.path.getsize(original_file_path), os.path.getsize(lean_path)); progress.lean_savings(*savings)
+            original_file_path = lean_path; media_hash = None
+        try: media = probe_media(original_file_path, media_hash)
+        except media_probe.ProbeError as e: progress.error(f"Could not read this file: {e}"); return None
+        duration_sec = media["duration"]; is_audio = media["video_codec"] is None
+        segment_len = plan_segment_length(duration_sec, media["bit_rate"], is_audio)
+
+        with progress.stage("Splitting lecture at natural pauses..."):
+            silences = detect_silences(original_file_path) if duration_sec > segment_len else []
+            chunk_paths = segment_media(original_file_path, work_dir, plan_cut_points(duration_sec, segment_len, silences, media["keyframes"]))
+        total_chunks = len(chunk_paths)
+        workers = max(1, min(max_workers, total_chunks))
+
+        progress.start_segments(total_chunks, workers)
+        raw_notes_accumulator = [None] * total_chunks
+        # Workers must not touch the UI, so they post progress here and the calling thread draws it.
+        events = queue.Queue()
+        report = lambda index, label: events.put((index, label))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            for i, chunk_path in enumerate(chunk_paths):
+                future = submit_traced(pool, process_media_segment, model, api_key, chunk_path, i, is_audio, custom_focus, report)
+                pending[future] = i
+            while pending:
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                while not events.empty():
+                    i, label = events.get_nowait(); progress.segment(i, label)
+                for future in done:
+                    i = pending.pop(future)
+                    try:
+                        raw_notes_accumulator[i] = future.result()
+                        progress.segment(i, f"Part {i+1}: done", "complete")
+                    except Exception as e:
+                        progress.segment(i, f"Part {i+1}: failed", "error"); progress.error(str(e))
+    finally: shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Results arrive out of order; the editor needs them in lecture order.
+    raw_notes_accumulator = [notes for notes in raw_notes_accumulator if notes]
+    if not raw_notes_accumulator: progress.error("No part of the lecture could be turned into notes."); return None
+    final_polished_notes = run_master_editor(raw_notes_accumulator, api_key, detail_level, custom_focus, placeholder=progress.live_text("✍️ Master Editor"))
+    if final_polished_notes.startswith("Error: "): progress.error(f"The master edit failed: {final_polished_notes[len('Error: '):]}"); return None
+    if len(raw_notes_accumulator) == total_chunks:
+        cache_put(job_key, final_polished_notes)
+        if lean_mode: cache_put(cache_key("lean_savings", job_key), json.dumps(savings))
+    return final_polished_notes
+
+def split_and_process_media(original_file_path, api_key, detail_level, custom_focus, max_workers=MAX_SEGMENT_WORKERS, media_hash=None, lean_mode=None):
+    progress = StreamlitProgress()
+    notes = generate_media_notes(original_file_path, api_key, detail_level, custom_focus, progress, max_workers, media_hash, lean_mode)
+    if notes is None: return
+    get_session_store().set_notes(current_session(), notes, lean_savings=progress.savings)
     st.balloons()
     st.rerun()
 
+def generate_text_notes(text_data, api_key, detail_level, custom_focus, placeholder=None):
+    model = gemini_model(api_key, "gemini-2.5-flash")
+    system_prompt = get_system_prompt(detail_level, "transcript", "", custom_focus)
+    key = cache_key("text", "gemini-2.5-flash", system_prompt, text_data)
+    notes = cache_get(key)
+    if notes is None:
+        notes = stream_generate(model, [system_prompt, text_data], placeholder, "text_notes"); cache_put(key, notes)
+    return notes
+
+# --- TRANSCRIPTS ---
+# Long transcripts are packed into token-budgeted windows that are summarised in parallel, so
+# a three-hour lecture takes about as long as a short one. The text keeps a [mm:ss] stamp every
+# TRANSCRIPT_STAMP_SEC; section headings start with one, which anchors the notes to the video.
+TRANSCRIPT_WINDOW_TOKENS = int(os.environ.get("LECTUREPRO_TRANSCRIPT_WINDOW_TOKENS", "8000"))
+MAX_TRANSCRIPT_WORKERS = int(os.environ.get("LECTUREPRO_TRANSCRIPT_WORKERS", "6"))
+TRANSCRIPT_STAMP_SEC = 30
+TIMESTAMP_RULE = """
+    TIMESTAMPS: The transcript carries [mm:ss] stamps. Begin EVERY section heading with the stamp where that topic starts, e.g. '## [12:34] Entropy'.
+    """
+
+def format_timestamp(seconds):
+    seconds = int(seconds); hours, minutes = seconds // 3600, seconds // 60 % 60
+    return f"{hours}:{minutes:02d}:{seconds % 60:02d}" if hours else f"{minutes:02d}:{seconds % 60:02d}"
+
+def split_transcript_windows(lines, budget=TRANSCRIPT_WINDOW_TOKENS):
+    # Caption lines become stamped paragraphs of ~TRANSCRIPT_STAMP_SEC, packed into windows.
+    paragraphs = []
+    for start, text in lines:
+        text = " ".join(text.split())
+        if not text: continue
+        if paragraphs and start < paragraphs[-1][0] + TRANSCRIPT_STAMP_SEC: paragraphs[-1][1].append(text)
+        else: paragraphs.append((start, [f"[{format_timestamp(start)}]", text]))
+    windows, current, used = [], [], 0
+    for start, words in paragraphs:
+        paragraph = " ".join(words); cost = estimate_tokens(paragraph)
+        if current and used + cost > budget: windows.append(current); current, used = [], 0
+        current.append((start, paragraph)); used += cost
+    if current: windows.append(current)
+    return windows
+
+def transcript_window_notes(model, window, index, total, detail_level, custom_focus):
+    part_info = f"Part {index+1} of {total} ({format_timestamp(window[0][0])} onwards)." if total > 1 else ""
+    system_prompt = get_system_prompt(detail_level, "transcript", part_info, custom_focus) + TIMESTAMP_RULE
+    text = "\n".join(paragraph for _, paragraph in window)
+    key = cache_key("transcript", model.model_name, system_prompt, text)
+    notes = cache_get(key)
+    if notes is None:
+        notes = stream_generate(model, [system_prompt, text], label="transcript_window"); cache_put(key, notes)
+    return notes
+
+def strip_tldr(notes): return re.sub(r"(?ms)^#{1,3} [^\n]*TL;DR.*?(?=^#|\Z)", "", notes).strip()
+
+def generate_transcript_notes(lines, api_key, detail_level, custom_focus, placeholder=None):
+    model = gemini_model(api_key, "gemini-2.5-flash")
+    windows = split_transcript_windows(lines)
+    if not windows: raise RuntimeError("The transcript is empty.")
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_TRANSCRIPT_WORKERS, len(windows)))) as pool:
+        futures = [submit_traced(pool, transcript_window_notes, model, window, i, len(windows), detail_level, custom_focus) for i, window in enumerate(windows)]
+        parts = [future.result() for future in futures]
+    if len(parts) == 1: return parts[0]
+    # Windows are already in lecture order, so they are joined as they are; only the overall
+    # TL;DR needs another call, and its short output keeps the merge fast.
+    body = "\n\n".join(strip_tldr(part) for part in parts)
+    prompt = f"""
+    Below are the notes of ONE lecture, in order. Write ONLY its '## ⚡ TL;DR' section (Core Topic, Difficulty /10, Exam Probability), at most 8 lines.
+    NOTES: {body}
+    """
+    key = cache_key("transcript_tldr", model.model_name, body)
+    tldr = cache_get(key)
+    if tldr is None:
+        tldr = stream_generate(model, prompt, placeholder, "transcript_tldr"); cache_put(key, tldr)
+    return f"{tldr}\n\n{body}"
+
 def process_text_content(text_data, api_key, detail_level, source_name, custom_focus):
-    genai.configure(api_key=api_key); model = genai.GenerativeModel(model_name="gemini-2.5-flash")
     with st.spinner(f'Analyzing...'):
         try:
-            system_prompt = get_system_prompt(detail_level, "transcript", "", custom_focus)
-            response = model.generate_content([system_prompt, text_data])
-            st.session_state["master_notes"] += f"\n\n# 📄 Notes from {source_name}\n{response.text}"
+            # Timestamped transcript lines (Speed Run) take the windowed path; plain text goes in one call.
+            generate = generate_transcript_notes if isinstance(text_data, list) else generate_text_notes
+            notes = generate(text_data, api_key, detail_level, custom_focus, st.empty())
+            get_session_store().set_notes(current_session(), f"# 📄 Notes from {source_name}\n{notes}", append=True)
             st.rerun()
         except Exception as e: st.error(f"Error: {e}")
 
+# --- SESSION STORE ---
+# Notes, chat history, quiz and mind map of every session live in SQLite (session_store), under
+# an id carried in the URL (?session=...), so a reload or a server restart picks the session up
+# again and memory only holds what the current rerun draws.
+SESSION_DB = os.environ.get("LECTUREPRO_SESSION_DB", os.path.join(tempfile.gettempdir(), "lecturepro_sessions.sqlite3"))
+SESSION_TTL_DAYS = int(os.environ.get("LECTUREPRO_SESSION_TTL_DAYS", "30"))
+CHAT_KEEP_MESSAGES = 200
+CHAT_SHOW_MESSAGES = 40
+NOTES_PAGE_SECTIONS = 12
+
+@st.cache_resource(show_spinner=False)
+def get_session_store(): return session_store.SessionStore(SESSION_DB, SESSION_TTL_DAYS, CHAT_KEEP_MESSAGES)
+
+def current_session(): return st.session_state["session_id"]
+
+def resume_session():
+    # Once per browser session: adopt ?session=<id> if the store knows it, else start a new one.
+    if "session_id" not in st.session_state:
+        requested = st.query_params.get("session")
+        if requested and get_session_store().exists(requested): get_session_store().touch(requested)
+        else: requested = uuid.uuid4().hex
+        st.session_state["session_id"] = requested
+    if st.query_params.get("session") != st.session_state["session_id"]: st.query_params["session"] = st.session_state["session_id"]
+    return st.session_state["session_id"]
+
+def start_over():
+    get_session_store().delete(current_session()); st.session_state.clear(); st.query_params.clear(); st.rerun()
+
+def jump_to_section(index): st.session_state["notes_section"] = index
+
+def render_notes(session):
+    # A table of contents and one page of sections around the chosen one: only that page is read
+    # from the store and drawn, however long the notes grow.
+    store = get_session_store(); toc = store.toc(session)
+    if st.session_state.get("notes_section", 0) >= len(toc): st.session_state["notes_section"] = 0
+    labels = [f"{'· ' * max(level - 1, 0)}{title}" for _, level, title in toc]
+    pick = st.selectbox("Contents", range(len(toc)), format_func=labels.__getitem__, key="notes_section")
+    start = pick // NOTES_PAGE_SECTIONS * NOTES_PAGE_SECTIONS; stop = min(start + NOTES_PAGE_SECTIONS, len(toc))
+    for (index, level, title), body in zip(toc[start:stop], store.sections(session, start, stop)):
+        with st.expander(title, expanded=index == pick):
+            st.markdown(body.split("\n", 1)[1] if level and "\n" in body else body)
+    if len(toc) > NOTES_PAGE_SECTIONS:
+        c1, c2, c3 = st.columns([1, 4, 1])
+        c1.button("← Previous", disabled=start == 0, on_click=jump_to_section, args=(start - NOTES_PAGE_SECTIONS,))
+        c2.caption(f"Sections {start + 1}–{stop} of {len(toc)}")
+        c3.button("Next →", disabled=stop >= len(toc), on_click=jump_to_section, args=(stop,))
+
+# --- CHAT RETRIEVAL ---
+# Chat turns send only the few #/## sections that best match the question (BM25), plus the
+# last few messages, instead of the whole notes document.
+CHAT_TOP_K = 4
+CHAT_HISTORY_MESSAGES = 6
+
+def tokenize(text): return re.findall(r"[a-z0-9]+", text.lower())
+
+class SectionIndex:
+    k1, b = 1.5, 0.75
+
+    def __init__(self):
+        self.sections, self.term_freqs, self.lengths = [], [], []
+        self.doc_freq = Counter()
+        self.indexed_chars, self.indexed_digest = 0, hashlib.sha256().hexdigest()
+
+    def add(self, text):
+        for section in session_store.split_sections(text):
+            terms = Counter(tokenize(section))
+            self.sections.append(section); self.term_freqs.append(terms); self.lengths.append(sum(terms.values()))
+            self.doc_freq.update(terms.keys())
+
+    def sync(self, notes):
+        # Notes normally only grow by appending, so index just the new tail; anything else
+        # (a fresh master edit) gets a full rebuild.
+        head = notes[:self.indexed_chars]
+        if hashlib.sha256(head.encode('utf-8')).hexdigest() != self.indexed_digest: self.__init__(); head = ""
+        if len(notes) > len(head): self.add(notes[len(head):])
+        self.indexed_chars, self.indexed_digest = len(notes), hashlib.sha256(notes.encode('utf-8')).hexdigest()
+
+    def search(self, query, k=CHAT_TOP_K):
+        if not self.sections: return []
+        n, avg_len = len(self.sections), sum(self.lengths) / len(self.sections) or 1
+        scores = [0.0] * n
+        for term in set(tokenize(query)):
+            df = self.doc_freq.get(term)
+            if not df: continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, terms in enumerate(self.term_freqs):
+                tf = terms.get(term)
+                if tf: scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / avg_len))
+        ranked = [i for i in sorted(range(n), key=lambda i: -scores[i]) if scores[i] > 0][:k]
+        # Nothing matched ("summarise this"): fall back to the opening sections, which hold the TL;DR.
+        return [self.sections[i] for i in sorted(ranked or range(min(k, n)))]
+
+# Indexes live in a process-wide LRU instead of each session, so idle sessions hold no notes.
+MAX_NOTES_INDEXES = 32
+
+@st.cache_resource
+def get_notes_indexes(): return OrderedDict(), threading.Lock()
+
+def update_notes_index(session, notes):
+    indexes, lock = get_notes_indexes()
+    with lock:
+        index = indexes.pop(session, None) or SectionIndex(); indexes[session] = index
+        while len(indexes) > MAX_NOTES_INDEXES: indexes.popitem(last=False)
+    index.sync(notes)
+    return index
+
+def build_chat_prompt(question, notes, session):
+    context = "\n\n---\n\n".join(update_notes_index(session, notes).search(question))
+    history = "\n".join(f"{m['role'].title()}: {m['content']}" for m in get_session_store().messages(session, CHAT_HISTORY_MESSAGES + 1)[:-1])
+    return f"Context (relevant sections of the lecture notes):\n{context}\n\nConversation so far:\n{history}\nUser: {question}"
+
+# --- ADMIN PANEL ---
+def render_admin_panel():
+    spans = list(get_trace_log())
+    with st.expander("🛠️ Admin: pipeline traces", expanded=True):
+        st.caption(f"{len(spans)} spans from {len({span['job'] for span in spans})} jobs in this process.")
+        totals = sorted(summarize_traces(spans).items(), key=lambda item: -item[1]["seconds"])
+        st.dataframe([{"stage": stage, "call": call, "calls": t["calls"], "seconds": round(t["seconds"], 2), "avg s": round(t["seconds"] / t["calls"], 3),
+                       "MB": round(t["bytes"] / (1024 * 1024), 2), "tokens in": t["tokens_in"], "tokens out": t["tokens_out"], "errors": t["errors"]} for (stage, call), t in totals])
+        # Busy seconds per stage; segments run in parallel, so they can add up to more than the job.
+        busy = {}
+        for span in spans:
+            if span["stage"] != "job": busy.setdefault(span["job"], Counter())[span["stage"]] += span["seconds"]
+        jobs = [span for span in reversed(spans) if span["stage"] == "job"]
+        if jobs:
+            st.markdown("**Jobs** (busy seconds per stage)")
+            st.dataframe([{"job": job["job"], "kind": job["call"], "source": job.get("source", ""), "seconds": round(job["seconds"], 2), "ok": job["ok"],
+                           **{stage: round(seconds, 2) for stage, seconds in busy.get(job["job"], {}).items()}} for job in jobs])
+        c1, c2, c3 = st.columns(3)
+        c1.download_button("Export JSON lines", traces_to_jsonl(spans), "traces.jsonl", "application/x-ndjson")
+        c2.download_button("Export Prometheus", traces_to_prometheus(spans), "metrics.prom", "text/plain")
+        if c3.button("Clear traces"): get_trace_log().clear(); st.rerun()
+        lanes = get_gemini().snapshot()
+        if lanes:
+            st.markdown("**Gemini lanes** (per key and model)"); st.dataframe(lanes)
+        if get_last_profile():
+            st.markdown("**Last profiled script run**"); st.code(get_last_profile()["text"])
+
 # --- MAIN RENDER ---
 def render_app():
+    session = resume_session()
+    gemini_client.SESSION.set(session)  # this session's turn in the Gemini queues
+    store = get_session_store()
     # --- SIDEBAR ---
     with st.sidebar:
         st.markdown('<div class="sidebar-logo">🎓 LecturePro</div>', unsafe_allow_html=True)
@@ -374,6 +1287,10 @@ def render_app():
         st.caption("CUSTOM FOCUS")
         custom_focus = st.text_area("Focus", placeholder="e.g. 'Focus on dates and names' or 'Explain like I'm 5'", label_visibility="collapsed")
         
+        st.caption("UPLOAD SIZE")
+        media_mode = st.radio("Media", list(LEAN_MEDIA_MODES), index=0, label_visibility="collapsed", help="Lean modes shrink videos to speech audio (and slide changes) before upload. Faster, but visuals without slides are lost.")
+        lean_mode = LEAN_MEDIA_MODES[media_mode]
+        
         st.markdown("---")
         
         # Student Deal Card (Apple AirPods 4)
@@ -393,34 +1310,43 @@ def render_app():
         else:
             api_key = st.text_input("API Key", type="password", placeholder="Enter Gemini API Key", label_visibility="collapsed")
             
-        if st.button("Reset App"): st.session_state.clear(); st.rerun()
+        if st.button("Reset App"): start_over()
+
+    if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN: render_admin_panel()
 
     # --- MAIN CONTENT OR RESULT ---
-    if st.session_state["master_notes"]:
+    notes_hash = store.notes_hash(session)
+    if notes_hash:
         # RESULT VIEW
         st.success("🎉 Notes Generated!")
+        if savings := store.lean_savings(session):
+            original_size, lean_size = savings
+            st.caption(f"Lean media uploaded {format_bytes(lean_size)} instead of {format_bytes(original_size)}.")
         t1, t2, t3, t4 = st.tabs(["📖 Notes", "💬 Chat", "📝 Quiz", "🧠 Mind Map"])
         
+        # Tabs all run on every rerun, so the quiz job starts as soon as notes appear. The full
+        # text is only read from the store where it is needed (PDF, chat turn, new artifact job).
+        load_notes = functools.partial(store.notes, session)
         with t1:
-            st.markdown(st.session_state["master_notes"])
-            pdf = convert_markdown_to_pdf(st.session_state["master_notes"])
-            st.download_button("Download PDF", pdf, "notes.pdf", "application/pdf")
-            if st.button("Start Over"): st.session_state.clear(); st.rerun()
+            c1, c2 = st.columns(2)
+            c1.download_button("Download PDF", lambda: build_notes_pdf(notes_hash, load_notes), "notes.pdf", "application/pdf")
+            if c2.button("Start Over"): start_over()
+            render_notes(session)
             
         with t2:
-            for m in st.session_state["messages"]: st.chat_message(m["role"]).markdown(m["content"])
+            shown = store.messages(session, CHAT_SHOW_MESSAGES); total = store.message_count(session)
+            if total > len(shown): st.caption(f"{total - len(shown)} earlier messages are not shown.")
+            for m in shown: st.chat_message(m["role"]).markdown(m["content"])
             if p := st.chat_input("Ask about your lecture..."):
-                st.session_state["messages"].append({"role":"user","content":p}); st.chat_message("user").markdown(p)
-                genai.configure(api_key=api_key); model = genai.GenerativeModel("gemini-2.5-flash")
-                res = model.generate_content(f"Context: {st.session_state['master_notes']}\nUser: {p}")
-                st.chat_message("assistant").markdown(res.text); st.session_state["messages"].append({"role":"assistant","content":res.text})
+                store.add_message(session, "user", p); st.chat_message("user").markdown(p)
+                model = gemini_model(api_key, "gemini-2.5-flash")
+                with st.chat_message("assistant"): answer = stream_generate(model, build_chat_prompt(p, load_notes(), session), st.empty(), "chat")
+                store.add_message(session, "assistant", answer)
                 
         with t3:
-            if st.button("Generate Quiz"): 
-                q = generate_quiz(st.session_state["master_notes"], api_key)
-                if q: st.session_state["quiz_data"] = q; st.rerun()
-            if st.session_state["quiz_data"]:
-                for i, q in enumerate(st.session_state["quiz_data"]):
+            quiz = artifact_view("quiz", notes_hash, load_notes, api_key, "Generate Quiz")
+            if quiz:
+                for i, q in enumerate(quiz):
                     st.markdown(f"**{i+1}. {q['question']}**")
                     cols = st.columns(2)
                     for idx, opt in enumerate(q['options']):
@@ -429,10 +1355,13 @@ def render_app():
                              else: st.error(f"Wrong. Answer: {q['answer']}")
                              
         with t4:
-            if st.button("Generate Map"):
-                c = generate_mindmap(st.session_state["master_notes"], api_key)
-                if c: st.session_state["mindmap_code"] = c; st.rerun()
-            if st.session_state["mindmap_code"]: st.graphviz_chart(st.session_state["mindmap_code"])
+            draw_mindmap(*local_mindmap(notes_hash, load_notes))
+            st.caption("Built from the headings and bullets of your notes.")
+            mindmap = artifact_view("mindmap", notes_hash, load_notes, api_key, "✨ Enhanced map (AI)", auto=False)
+            if mindmap:
+                st.markdown("#### ✨ Enhanced map")
+                try: draw_mindmap(mindmap, render_dot_svg(notes_digest(mindmap), mindmap))
+                except graphviz.CalledProcessError as e: st.error(f"The enhanced map could not be drawn: {e}")
 
     else:
         # LANDING PAGE VIEW
@@ -457,11 +1386,12 @@ def render_app():
                 if uploaded_file and api_key:
                     if st.button("Process Uploaded File 🚀", use_container_width=True):
                         file_ext = os.path.splitext(uploaded_file.name)[1].lower()
-                        if file_ext in ['.txt', '.md']: process_text_content(uploaded_file.read().decode("utf-8"), api_key, detail_level, "Text", custom_focus)
-                        else:
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp: tmp.write(uploaded_file.read()); path = tmp.name
-                            try: split_and_process_media(path, api_key, detail_level, custom_focus)
-                            finally: os.unlink(path)
+                        with trace_job("upload", uploaded_file.name):
+                            if file_ext in ['.txt', '.md']: process_text_content(uploaded_file.read().decode("utf-8"), api_key, detail_level, "Text", custom_focus)
+                            else:
+                                path, media_hash = ingest_upload(uploaded_file, file_ext)
+                                try: split_and_process_media(path, api_key, detail_level, custom_focus, media_hash=media_hash, lean_mode=lean_mode)
+                                finally: os.unlink(path)
 
             # 2. YOUTUBE SECTION
             st.markdown("---")
@@ -472,19 +1402,22 @@ def render_app():
             # Action Buttons
             if c_btn1.button("⚡ Speed Run"):
                 if api_key and yt_url:
-                    vid_id = get_video_id(yt_url); trans = get_transcript(vid_id)
-                    if trans: process_text_content(trans, api_key, detail_level, "YouTube", custom_focus)
-                    else: st.error("No transcript found.")
+                    with trace_job("youtube_transcript", yt_url):
+                        vid_id = get_video_id(yt_url); trans = get_transcript(vid_id)
+                        if trans: process_text_content(trans, api_key, detail_level, "YouTube", custom_focus)
+                        else: st.error("No transcript found.")
             
             if c_btn2.button("🎧 Audio"):
                 if api_key and yt_url:
-                    path = download_audio_from_youtube(yt_url)
-                    if path: split_and_process_media(path, api_key, detail_level, custom_focus)
+                    with trace_job("youtube_audio", yt_url), job_workspace() as workspace:
+                        path = download_audio_from_youtube(yt_url, workspace)
+                        if path: split_and_process_media(path, api_key, detail_level, custom_focus, lean_mode=lean_mode)
             
             if c_btn3.button("📹 Full Video", type="primary"):
                  if api_key and yt_url:
-                    path = download_video_from_youtube(yt_url)
-                    if path: split_and_process_media(path, api_key, detail_level, custom_focus)
+                    with trace_job("youtube_video", yt_url), job_workspace() as workspace:
+                        path = download_video_from_youtube(yt_url, workspace)
+                        if path: split_and_process_media(path, api_key, detail_level, custom_focus, lean_mode=lean_mode)
 
             # 3. ECHO360 GUIDE
             st.markdown("""
@@ -507,4 +1440,6 @@ def render_app():
             </div>
             """, unsafe_allow_html=True)
 
-render_app()
\ No newline at end of file
+if __name__ == "__main__":
+    if PROFILE_DIR: run_profiled(render_app)
+    else: render_app()
\ No newline at end of file
@@ -0,0 +1,156 @@
+# Headless batch runner: turns a folder of lecture recordings and/or a list of YouTube URLs
+# into notes (.md) and PDFs, reusing the app's pipeline without a browser.
+#   GOOGLE_API_KEY=... python batch.py lectures/ --urls playlist.txt --out notes/ --workers 2
+# Progress is kept in <out>/manifest.json; re-running the same command skips finished lectures.
+# Set LECTUREPRO_TRACE_FILE to collect per-stage timings from every worker as JSON lines.
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import streamlit.logger  # noqa: E402  (quiet the bare-mode warnings before app is imported)
+streamlit.logger.set_log_level("error")
+import app  # noqa: E402
+
+MEDIA_EXTS = ('.mp3', '.wav', '.m4a', '.mp4', '.mov', '.mkv', '.webm')
+TEXT_EXTS = ('.txt', '.md')
+DETAIL_LEVELS = ("Summary (Concise)", "Comprehensive", "Exhaustive")
+
+class ConsoleProgress:
+    # Same methods as app.StreamlitProgress, printed as plain lines prefixed with the job id.
+    def __init__(self, job_id): self.job_id = job_id
+    def say(self, message): print(f"[{self.job_id}] {message}", flush=True)
+    @contextlib.contextmanager
+    def stage(self, label): self.say(label); yield
+    def info(self, message): self.say(message)
+    def error(self, message): self.say(f"ERROR: {message}")
+    def lean_savings(self, original_size, lean_size): self.say(f"Lean media: {app.format_bytes(original_size)} → {app.format_bytes(lean_size)}")
+    def start_segments(self, total, workers): self.say(f"Processing {total} segments ({workers} at a time)...")
+    def segment(self, index, label, state="running"):
+        if state != "running": self.say(label)
+    def live_text(self, title): self.say(title); return None
+
+# --- JOBS ---
+def slugify(text): return re.sub(r"[^A-Za-z0-9_-]+", "-", text).strip("-")[:80] or "lecture"
+
+def job_id(name, source):
+    # Readable name plus a hash of the source, so an id means the same lecture whatever else
+    # is in the run and in whatever order (a/lec.txt and b/lec.txt, lec.mp4 next to lec.txt).
+    return f"{slugify(name)}-{hashlib.sha256(source.encode('utf-8')).hexdigest()[:8]}"
+
+def collect_jobs(inputs, url_files):
+    jobs = []
+    for source in inputs:
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))] if os.path.isdir(source) else [source]
+        for path in paths:
+            ext = os.path.splitext(path)[1].lower()
+            if ext in MEDIA_EXTS + TEXT_EXTS: jobs.append({"id": job_id(os.path.splitext(os.path.basename(path))[0], os.path.abspath(path)), "source": os.path.abspath(path)})
+    for url_file in url_files:
+        with open(url_file, encoding="utf-8") as f:
+            for line in f:
+                url = line.strip()
+                if url and not url.startswith("#"): jobs.append({"id": job_id(app.get_video_id(url) or url, url), "source": url})
+    return list({job["id"]: job for job in jobs}.values())  # a source given twice runs once
+
+def load_manifest(path):
+    if not os.path.exists(path): return {"jobs": {}}
+    with open(path, encoding="utf-8") as f: return json.load(f)
+
+def is_done(manifest, job):
+    # Only an entry recorded for this very source counts.
+    entry = manifest["jobs"].get(job["id"], {})
+    return entry.get("status") == "done" and entry.get("source") == job["source"]
+
+def save_manifest(path, manifest):
+    # Written to a temp file and swapped in, so an interrupted run never leaves a half manifest.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def make_notes(job, options, progress):
+    source = job["source"]
+    if source.startswith(("http://", "https://")):
+        if options["youtube"] == "transcript":
+            transcript = app.get_transcript(app.get_video_id(source))
+            if not transcript: raise RuntimeError("No transcript found.")
+            return app.generate_transcript_notes(transcript, options["api_key"], options["detail"], options["focus"])
+        with app.job_workspace() as workspace:
+            with progress.stage("Downloading..."): path = app.fetch_youtube(source, options["youtube"], workspace)
+            return app.generate_media_notes(path, options["api_key"], options["detail"], options["focus"], progress, options["segment_workers"], lean_mode=options["lean"])
+    if source.lower().endswith(TEXT_EXTS):
+        with open(source, encoding="utf-8") as f: text_data = f.read()
+        return app.generate_text_notes(text_data, options["api_key"], options["detail"], options["focus"])
+    return app.generate_media_notes(source, options["api_key"], options["detail"], options["focus"], progress, options["segment_workers"], lean_mode=options["lean"])
+
+def run_job(job, options):
+    # Runs in a pool process; returns the manifest entry instead of raising.
+    started = time.perf_counter(); progress = ConsoleProgress(job["id"])
+    entry = {"source": job["source"], "status": "failed"}
+    try:
+        with app.trace_job("batch", job["source"]):
+            notes = make_notes(job, options, progress)
+            if not notes: raise RuntimeError("No notes were generated.")
+            if notes.startswith("Error: "): raise RuntimeError(notes[len("Error: "):])
+            notes_path = os.path.join(options["out"], f"{job['id']}.md"); pdf_path = os.path.join(options["out"], f"{job['id']}.pdf")
+            with open(notes_path, "w", encoding="utf-8") as f: f.write(notes)
+            with open(pdf_path, "wb") as f: f.write(app.convert_markdown_to_pdf(notes))
+        entry.update(status="done", notes=notes_path, pdf=pdf_path)
+    except Exception as e: entry["error"] = str(e); progress.error(e)
+    entry["seconds"] = round(time.perf_counter() - started, 1)
+    return entry
+
+# --- MAIN ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate lecture notes and PDFs without the web UI.")
+    parser.add_argument("inputs", nargs="*", help="Media/text files or folders of them")
+    parser.add_argument("--urls", action="append", default=[], help="Text file with one YouTube URL per line (repeatable)")
+    parser.add_argument("--out", default="notes_out", help="Output folder for notes, PDFs and manifest.json")
+    parser.add_argument("--workers", type=int, default=2, help="Lectures processed at the same time")
+    parser.add_argument("--segment-workers", type=int, default=app.MAX_SEGMENT_WORKERS, help="Concurrent segments per lecture")
+    parser.add_argument("--detail", choices=DETAIL_LEVELS, default="Comprehensive")
+    parser.add_argument("--focus", default="", help="Custom focus, as in the sidebar")
+    parser.add_argument("--lean", choices=[mode for mode in app.LEAN_MEDIA_MODES.values() if mode], help="Shrink media before upload")
+    parser.add_argument("--youtube", choices=("transcript", "audio", "video"), default="transcript", help="How URL jobs are processed")
+    parser.add_argument("--force", action="store_true", help="Redo lectures the manifest marks as done")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.urls: parser.error("give at least one input or --urls file")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key: sys.exit("Set GOOGLE_API_KEY to your Gemini API key.")
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, "manifest.json"); manifest = load_manifest(manifest_path)
+    jobs = collect_jobs(args.inputs, args.urls)
+    todo = [job for job in jobs if args.force or not is_done(manifest, job)]
+    print(f"{len(jobs)} lectures, {len(jobs) - len(todo)} already done, {len(todo)} to run with {args.workers} workers.", flush=True)
+    options = {"api_key": api_key, "out": os.path.abspath(args.out), "detail": args.detail, "focus": args.focus,
+               "lean": args.lean, "youtube": args.youtube, "segment_workers": args.segment_workers}
+
+    started = time.perf_counter(); done = failed = 0
+    # Each worker process has its own Gemini scheduler, so the key's quota is split between them.
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=app.split_gemini_quota, initargs=(max(1, args.workers),)) as pool:
+        futures = {pool.submit(run_job, job, options): job for job in todo}
+        for job in todo: manifest["jobs"][job["id"]] = {"source": job["source"], "status": "running"}
+        save_manifest(manifest_path, manifest)
+        for future in as_completed(futures):
+            job = futures[future]
+            try: entry = future.result()
+            except Exception as e: entry = {"source": job["source"], "status": "failed", "error": str(e)}  # worker died
+            manifest["jobs"][job["id"]] = entry; save_manifest(manifest_path, manifest)
+            if entry["status"] == "done": done += 1
+            else: failed += 1
+            print(f"[{job['id']}] {entry['status']} in {entry.get('seconds', 0)}s", flush=True)
+
+    elapsed = time.perf_counter() - started
+    rate = done / (elapsed / 3600) if done and elapsed else 0
+    print(f"Finished {done} lectures ({failed} failed) in {elapsed / 60:.1f} min: {rate:.1f} lectures/hour.")
+    return 1 if failed else 0
+
+if __name__ == "__main__": sys.exit(main())
@@ -0,0 +1,86 @@
+# Benchmark: PDF export of large generated notes, current renderer vs the original
+# per-line multi_cell/write renderer, and a repeat export served from build_notes_pdf's cache.
+#   python benchmarks/bench_pdf.py --sections 150
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit  # noqa: E402  (quiet the bare-mode warnings before app is imported)
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+import app  # noqa: E402
+
+WORDS = ("entropy enthalpy system energy heat work process reversible isothermal adiabatic gas volume "
+         "pressure temperature equilibrium state function cycle efficiency Carnot boundary").split()
+
+class LegacyPDF(app.ModernPDF):
+    # chapter_body as it was before the layout rework, for comparison.
+    def chapter_body(self, body):
+        self.set_font('Helvetica', '', 11); self.set_text_color(20, 20, 20)
+        for line in body.split('\n'):
+            line = line.strip()
+            if not line: self.ln(2); continue
+            safe_line = line.replace('•', chr(149)).replace('—', '-')
+            if '**' in safe_line:
+                parts = safe_line.split('**')
+                for i, part in enumerate(parts):
+                    if i % 2 == 0: self.set_font('Helvetica', '', 11)
+                    else: self.set_font('Helvetica', 'B', 11)
+                    self.write(6, part.encode('windows-1252', 'replace').decode('windows-1252'))
+                self.ln(6)
+            else:
+                self.set_font('Helvetica', '', 11)
+                if safe_line.startswith(chr(149)) or safe_line.startswith('-'): self.set_x(15)
+                else: self.set_x(10)
+                self.multi_cell(0, 6, safe_line.encode('windows-1252', 'replace').decode('windows-1252'))
+        self.ln(4)
+
+def generate_notes(sections, seed=0):
+    rng = random.Random(seed)
+    sentence = lambda n: " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+    lines = ["## ⚡ TL;DR", "- **Core Topic:** Thermodynamics", "- **Difficulty:** 7/10", ""]
+    for s in range(sections):
+        lines.append(f"{'#' if s % 5 == 0 else '##'} Section {s + 1}: {sentence(4)}")
+        for _ in range(rng.randint(8, 16)):
+            kind = rng.random()
+            if kind < 0.45: lines.append(f"• {sentence(rng.randint(6, 30))}")
+            elif kind < 0.6: lines.append(f"- **{rng.choice(WORDS).title()}:** {sentence(rng.randint(6, 25))}")
+            else: lines.append(" ".join(sentence(rng.randint(8, 20)) for _ in range(rng.randint(2, 5))) + " — see above.")
+        lines.append("")
+    return "\n".join(lines)
+
+def convert_with(pdf_class, markdown_text):
+    original = app.ModernPDF
+    app.ModernPDF = pdf_class
+    try: return app.convert_markdown_to_pdf(markdown_text)
+    finally: app.ModernPDF = original
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter(); result = fn(); best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, default=150, help="number of note sections to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per renderer; the best time is reported")
+    args = parser.parse_args()
+
+    notes = generate_notes(args.sections)
+    legacy_s, legacy_pdf = timed(lambda: convert_with(LegacyPDF, notes), args.repeat)
+    current_s, current_pdf = timed(lambda: convert_with(app.ModernPDF, notes), args.repeat)
+    pages = lambda pdf: pdf.count(b"/Type /Page\n")
+    print(f"markdown: {len(notes) / 1024:.0f} KB, {args.sections} sections")
+    print(f"legacy : {legacy_s:.3f}s  ({pages(legacy_pdf)} pages)")
+    print(f"current: {current_s:.3f}s  ({pages(current_pdf)} pages)")
+    print(f"speedup: {legacy_s / current_s:.1f}x")
+    notes_hash = app.notes_digest(notes); app.build_notes_pdf(notes_hash, lambda: notes)
+    cached_s, _ = timed(lambda: app.build_notes_pdf(notes_hash, lambda: notes), args.repeat)
+    print(f"cached : {cached_s * 1000:.2f}ms  (same notes again)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Benchmark: the whole pipeline on synthetic lectures from 10 minutes to 4 hours, against the
+# fake Gemini in fake_genai.py. Audio and video are generated once with ffmpeg and kept in
+# --media-dir. Every case runs in a fresh interpreter with an empty result cache, so its peak RSS
+# and per-stage times (the app's own trace spans) belong to that case alone. Results are saved
+# per commit in benchmarks/results/<commit>.json and can be compared with an earlier run:
+#   python benchmarks/bench_pipeline.py --cases audio:10,video:60,transcript:240
+#   python benchmarks/bench_pipeline.py --compare HEAD~1
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS_DIR = os.path.join(HERE, "results")
+KINDS = ("audio", "video", "transcript", "text")
+DEFAULT_CASES = "audio:10,audio:60,audio:240,video:10,video:60,video:240,transcript:60,transcript:240,text:60"
+# A 220 Hz tone with a short gap every 7 s and a longer one every 90 s, so the segmenter finds pauses.
+SPEECH = "0.3*sin(2*PI*220*t)*gt(mod(t,7),0.8)*gt(mod(t,90),2)"
+CAPTION_SEC = 4
+WORDS = ("entropy enthalpy system energy heat work process reversible isothermal adiabatic gas volume "
+         "pressure temperature equilibrium state function cycle efficiency Carnot boundary").split()
+
+# --- SYNTHETIC LECTURES ---
+def ffmpeg_binary():
+    found = shutil.which("ffmpeg")
+    if found: return found
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def synth_media(kind, minutes, media_dir):
+    path = os.path.join(media_dir, f"{kind}-{minutes}min.{'m4a' if kind == 'audio' else 'mp4'}")
+    if os.path.exists(path): return path
+    seconds = minutes * 60; tmp_path = f"{path}.part{os.path.splitext(path)[1]}"
+    audio = ["-f", "lavfi", "-i", f"aevalsrc='{SPEECH}':s=16000:d={seconds}"]
+    video = ["-f", "lavfi", "-i", f"testsrc2=size=320x180:rate=5:duration={seconds}"] if kind == "video" else []
+    video_codec = ["-c:v", "libx264", "-preset", "ultrafast", "-g", "150"] if kind == "video" else []
+    print(f"generating {os.path.basename(path)}...", flush=True)
+    subprocess.run([ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error", *video, *audio, *video_codec,
+                    "-c:a", "aac", "-b:a", "48k", "-shortest", tmp_path], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+def synth_transcript(minutes):
+    # [(start, text)] captions every CAPTION_SEC, about 150 spoken words a minute.
+    words_per_caption = 150 * CAPTION_SEC // 60
+    return [(t, " ".join(WORDS[(t + i) % len(WORDS)] for i in range(words_per_caption))) for t in range(0, minutes * 60, CAPTION_SEC)]
+
+# --- CHILD: ONE CASE ---
+class QuietProgress:
+    # app.StreamlitProgress's methods, drawing nothing.
+    def stage(self, label): return contextlib.nullcontext()
+    def info(self, message): pass
+    def error(self, message): print(message, file=sys.stderr)
+    def lean_savings(self, original_size, lean_size): pass
+    def start_segments(self, total, workers): pass
+    def segment(self, index, label, state="running"): pass
+    def live_text(self, title): return None
+
+def peak_rss_mb(children=False):
+    try: import resource
+    except ImportError: return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB elsewhere
+
+def run_case(kind, minutes, source, workers):
+    sys.path[:0] = [ROOT, HERE]
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+    import app
+    import fake_genai
+    rss_import = peak_rss_mb()
+    started = time.perf_counter()
+    with app.trace_job("bench", f"{kind}:{minutes}"):
+        if kind in ("audio", "video"): notes = app.generate_media_notes(source, "bench-key", "Comprehensive", "", QuietProgress(), workers)
+        elif kind == "transcript": notes = app.generate_transcript_notes(synth_transcript(minutes), "bench-key", "Comprehensive", "")
+        else: notes = app.generate_text_notes(" ".join(text for _, text in synth_transcript(minutes)), "bench-key", "Comprehensive", "")
+        if not notes or notes.startswith("Error: "): raise RuntimeError(notes or "the media could not be read")
+        notes_s = time.perf_counter() - started
+        pdf = app.convert_markdown_to_pdf(notes)
+    wall = time.perf_counter() - started
+    stages = {f"{stage}:{call}" if call else stage: {"calls": t["calls"], "seconds": round(t["seconds"], 3)}
+              for (stage, call), t in app.summarize_traces(app.get_trace_log()).items() if stage != "job"}
+    return {"wall_s": round(wall, 3), "notes_s": round(notes_s, 3), "pdf_s": round(wall - notes_s, 3), "realtime_x": round(minutes * 60 / wall, 1),
+            "input_mb": round(os.path.getsize(source) / (1024 * 1024), 1) if source else 0, "notes_kb": round(len(notes.encode("utf-8")) / 1024, 1),
+            "pdf_kb": round(len(pdf) / 1024, 1), "rss_import_mb": rss_import, "rss_peak_mb": peak_rss_mb(), "ffmpeg_rss_peak_mb": peak_rss_mb(children=True),
+            "fake_calls": dict(fake_genai.calls), "stages": stages}
+
+# --- PARENT ---
+def parse_case(case):
+    kind, _, minutes = case.partition(":")
+    if kind not in KINDS or not minutes.isdigit(): raise argparse.ArgumentTypeError(f"bad case {case!r}; use kind:minutes with kind in {', '.join(KINDS)}")
+    return kind, int(minutes)
+
+def run_child(case, source, args):
+    cache_dir = tempfile.mkdtemp(prefix="lecturepro_bench_cache_")
+    env = {**os.environ, "LECTUREPRO_GENAI_MODULE": "fake_genai", "LECTUREPRO_CACHE_DIR": cache_dir, "LECTUREPRO_FAKE_TIME_SCALE": str(args.time_scale)}
+    env.pop("LECTUREPRO_TRACE_FILE", None)
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", case, "--source", source, "--workers", str(args.workers)],
+                                env=env, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    finally: shutil.rmtree(cache_dir, ignore_errors=True)
+    if result.returncode != 0: sys.exit(f"{case} failed:\n{result.stderr[-3000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def git(*args): return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+
+def commit_id(ref="HEAD"):
+    sha = git("rev-parse", "--short", ref) or "unknown"
+    return f"{sha}-dirty" if ref == "HEAD" and git("status", "--porcelain", "--untracked-files=no") else sha
+
+def report(case, r):
+    top = sorted(r["stages"].items(), key=lambda item: -item[1]["seconds"])[:4]
+    rss = f"{r['rss_peak_mb']:7.1f} MB" if r["rss_peak_mb"] is not None else "      n/a"
+    print(f"{case:<16} {r['wall_s']:8.2f} s {r['realtime_x']:8.1f}x realtime   peak RSS {rss}   "
+          + ", ".join(f"{stage} {t['seconds']:.2f}s" for stage, t in top))
+
+def compare(current, previous):
+    print(f"\nvs {previous['commit']} ({previous['created']}):")
+    for case, r in current["cases"].items():
+        old = previous["cases"].get(case)
+        if not old: print(f"{case:<16} (not in the earlier run)"); continue
+        change = lambda new, before: f"{(new - before) / before * 100:+6.1f}%" if before else "   n/a"
+        rss = change(r["rss_peak_mb"], old["rss_peak_mb"]) if r["rss_peak_mb"] and old["rss_peak_mb"] else "   n/a"
+        print(f"{case:<16} wall {old['wall_s']:8.2f} s -> {r['wall_s']:8.2f} s ({change(r['wall_s'], old['wall_s'])})   peak RSS {rss}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark on synthetic lectures with a fake Gemini.")
+    parser.add_argument("--cases", default=DEFAULT_CASES, help="comma-separated kind:minutes, kind one of " + ", ".join(KINDS))
+    parser.add_argument("--media-dir", default=os.path.join(tempfile.gettempdir(), "lecturepro_bench_media"), help="where generated media is kept between runs")
+    parser.add_argument("--workers", type=int, default=3, help="segment workers, as LECTUREPRO_SEGMENT_WORKERS")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="fake Gemini latency scale (1.0 is roughly real)")
+    parser.add_argument("--compare", metavar="REF", help="commit (or results .json) to compare against")
+    parser.add_argument("--no-save", action="store_true", help="don't write benchmarks/results/<commit>.json")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--source", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, minutes = parse_case(args.child)
+        print(json.dumps(run_case(kind, minutes, args.source, args.workers)))
+        return
+
+    cases = [parse_case(case.strip()) for case in args.cases.split(",") if case.strip()]
+    os.makedirs(args.media_dir, exist_ok=True)
+    run = {"commit": commit_id(), "created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+           "platform": platform.platform(), "time_scale": args.time_scale, "workers": args.workers, "cases": {}}
+    print(f"commit {run['commit']}, fake Gemini at {args.time_scale}x real latency, {args.workers} segment workers")
+    for kind, minutes in cases:
+        source = synth_media(kind, minutes, args.media_dir) if kind in ("audio", "video") else ""
+        case = f"{kind}:{minutes}"
+        run["cases"][case] = run_child(case, source, args); report(case, run["cases"][case])
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{run['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f: json.dump(run, f, indent=2)
+        print(f"\nsaved {os.path.relpath(path, ROOT)}")
+    if args.compare:
+        path = args.compare if args.compare.endswith(".json") else os.path.join(RESULTS_DIR, f"{commit_id(args.compare)}.json")
+        if not os.path.exists(path): sys.exit(f"no results for {args.compare} ({path}); run the benchmark on that commit first")
+        with open(path, encoding="utf-8") as f: compare(run, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Stand-in for google.generativeai with the calls the app makes (GenerativeModel.generate_content,
+# and create_file/get_file on the per-key clients of client._ClientManager) and no network. Uploads, PROCESSING and generation take time
+# in proportion to the work, like the service, scaled by LECTUREPRO_FAKE_TIME_SCALE (1.0 is
+# roughly real latency). Replies are synthetic notes sized like real ones, so merging, chat and
+# PDF export see realistic input.
+#   LECTUREPRO_GENAI_MODULE=fake_genai PYTHONPATH=benchmarks streamlit run app.py
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import Counter
+
+TIME_SCALE = float(os.environ.get("LECTUREPRO_FAKE_TIME_SCALE", "0.05"))
+UPLOAD_BYTES_PER_SEC = 25 * 1024 * 1024
+PROCESSING_SEC_PER_MB = 0.5
+FIRST_TOKEN_SEC = 1.5
+TOKENS_PER_SEC = 200
+MEDIA_TOKENS_PER_MB = 2000   # prompt tokens one uploaded MB stands for
+OUTPUT_RATIO = 0.5           # reply tokens per prompt token, within the bounds below
+MIN_OUTPUT_TOKENS = 300
+MAX_OUTPUT_TOKENS = 8192
+CHUNK_TOKENS = 64
+WORDS = ("entropy enthalpy system energy heat work process reversible isothermal adiabatic gas volume "
+         "pressure temperature equilibrium state function cycle efficiency Carnot boundary").split()
+
+calls = Counter()
+calls_lock = threading.Lock()
+files = {}
+failures = []   # APIErrors the next generate_content calls raise, oldest first
+
+def count(kind):
+    with calls_lock: calls[kind] += 1
+
+def pause(seconds): time.sleep(seconds * TIME_SCALE)
+
+class FileState:
+    def __init__(self, name): self.name = name
+
+class File:
+    def __init__(self, name, size_bytes, ready_at): self.name = name; self.size_bytes = size_bytes; self.ready_at = ready_at
+    @property
+    def state(self): return FileState("ACTIVE" if time.monotonic() >= self.ready_at else "PROCESSING")
+
+class FileClient:
+    def create_file(self, path, **kwargs):
+        count("upload"); size = os.path.getsize(path)
+        pause(size / UPLOAD_BYTES_PER_SEC)
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        uploaded = files[name] = File(name, size, time.monotonic() + size / (1024 * 1024) * PROCESSING_SEC_PER_MB * TIME_SCALE)
+        return uploaded
+
+    def get_file(self, name): count("get_file"); return files[name]
+
+class ClientManager:
+    def configure(self, api_key=None, **kwargs): self.api_key = api_key
+    def get_default_client(self, name): return FileClient() if name == "file" else None
+
+# Importable as f"{genai.__name__}.client", like the SDK's submodule.
+client = sys.modules[f"{__name__}.client"] = types.ModuleType(f"{__name__}.client")
+client._ClientManager = ClientManager
+
+def synthetic_notes(tokens, seed):
+    rng = random.Random(seed)
+    sentence = lambda n: " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+    lines = ["## ⚡ TL;DR", "- **Core Topic:** Thermodynamics", "- **Difficulty:** 6/10", ""]
+    section, budget = 0, tokens * 4
+    while sum(map(len, lines)) < budget:
+        section += 1; lines.append(f"## Section {section}: {sentence(3)}")
+        for _ in range(rng.randint(4, 10)):
+            lines.append(f"- **{rng.choice(WORDS).title()}:** {sentence(rng.randint(6, 20))}" if rng.random() < 0.4 else f"• {sentence(rng.randint(8, 25))}")
+        lines.append("")
+    return "\n".join(lines)
+
+def reply_text(prompt, output_tokens, seed):
+    # Quiz and mind map prompts get answers in the shape the app parses.
+    if "multiple choice" in prompt:
+        return '[{"question": "Which quantity never decreases in an isolated system?", "options": ["A) Energy", "B) Entropy"], "answer": "B) Entropy"}]'
+    if "Graphviz" in prompt: return '```dot\ndigraph G { "Thermodynamics" -> "Entropy"; "Thermodynamics" -> "Work"; }\n```'
+    return synthetic_notes(output_tokens, seed)
+
+class APIError(Exception):
+    # Shaped like google.api_core's errors: an HTTP status in `code`, the server's text in the message.
+    def __init__(self, code, message=""): super().__init__(f"{code} {message}"); self.code = code
+
+class Response:
+    def __init__(self, text, prompt_tokens=0, output_tokens=0):
+        self.text = text
+        self.usage_metadata = types.SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens, total_token_count=prompt_tokens + output_tokens)
+
+class GenerativeModel:
+    def __init__(self, model_name="gemini-2.5-flash", **kwargs): self.model_name = model_name if "/" in model_name else f"models/{model_name}"
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        count("generate")
+        with calls_lock: failure = failures.pop(0) if failures else None
+        if failure: raise failure
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        prompt = "\n".join(part for part in parts if isinstance(part, str))
+        prompt_tokens = len(prompt) // 4 + sum(int(part.size_bytes / (1024 * 1024) * MEDIA_TOKENS_PER_MB) for part in parts if isinstance(part, File))
+        output_tokens = max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, int(prompt_tokens * OUTPUT_RATIO)))
+        text = reply_text(prompt, output_tokens, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        pause(FIRST_TOKEN_SEC)
+        if not stream:
+            pause(output_tokens / TOKENS_PER_SEC)
+            return Response(text, prompt_tokens, output_tokens)
+        return self.stream(text, prompt_tokens, output_tokens)
+
+    def stream(self, text, prompt_tokens, output_tokens):
+        step = CHUNK_TOKENS * 4
+        for start in range(0, len(text), step):
+            if start: pause(CHUNK_TOKENS / TOKENS_PER_SEC)
+            last = start + step >= len(text)
+            yield Response(text[start:start + step], prompt_tokens if last else 0, output_tokens if last else 0)
@@ -0,0 +1,176 @@
+# Process-wide access to Gemini. Model instances are shared per (API key, model); every call
+# is admitted through a per-key, per-model lane with token buckets for requests and prompt
+# tokens per minute, sessions take turns in round-robin order, and transient failures (429 and
+# 5xx) are retried with jittered exponential backoff. A 429 pauses the whole lane for the delay
+# the server asks for, so callers sharing a key back off together instead of all failing.
+# Each key has its own SDK clients; genai.configure() is process-wide and the SDK only reads it
+# on a model's first call, so with several keys in one process a call could go out under
+# whichever key was configured last.
+# The SDK module is passed in, so a fake with the same surface can stand in for tests.
+import contextvars
+import importlib
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+
+# Paid tier 1 quotas (requests, prompt tokens per minute); unknown models get FALLBACK_LIMITS.
+DEFAULT_LIMITS = {"gemini-2.5-pro": (150, 2_000_000), "gemini-2.5-flash": (1000, 1_000_000)}
+FALLBACK_LIMITS = (60, 1_000_000)
+# Uploaded media is priced by duration, which the call can't see; settled after the reply.
+MEDIA_PART_TOKENS = 100_000
+RETRY_CODES = (408, 429, 500, 502, 503, 504)
+# Whose turn a call takes in the round-robin; app.py sets it to the Streamlit session.
+SESSION = contextvars.ContextVar("gemini_session", default="-")
+
+class GeminiUnavailable(RuntimeError): pass
+
+def estimate_tokens(contents):
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    return sum(len(part) // 4 + 1 if isinstance(part, str) else MEDIA_PART_TOKENS for part in parts)
+
+def status_code(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int): return code
+    match = re.match(r"\s*(\d{3}) ", str(error))  # google.api_core errors read "429 Resource exhausted..."
+    return int(match.group(1)) if match else None
+
+def retry_hint(error):
+    # The server's suggested delay, from "Please retry in 23.4s" or a RetryInfo "retry_delay { seconds: 23 }".
+    match = re.search(r"retry in (\d+(?:\.\d+)?)s", str(error)) or re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", str(error))
+    return float(match.group(1)) if match else 0.0
+
+def prompt_tokens(response):
+    return getattr(getattr(response, "usage_metadata", None), "prompt_token_count", 0) or 0
+
+class TokenBucket:
+    # Refills `per_minute` units evenly over a minute and holds at most a minute's worth. The level
+    # may go below zero when a call costs more than its estimate; later callers wait it out.
+    def __init__(self, per_minute):
+        self.capacity = per_minute; self.rate = per_minute / 60; self.level = float(per_minute); self.updated = time.monotonic()
+    def refill(self):
+        now = time.monotonic(); self.level = min(self.capacity, self.level + (now - self.updated) * self.rate); self.updated = now
+    def delay(self, amount):
+        # Seconds until `amount` can be taken; anything larger than the bucket only needs it full.
+        self.refill(); return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+    def take(self, amount): self.refill(); self.level -= amount
+
+class Lane:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm); self.tokens = TokenBucket(tpm)
+        self.queues = {}       # session -> tickets waiting, oldest first
+        self.turns = deque()   # sessions with waiting tickets, in round-robin order
+        self.paused_until = 0.0
+        self.stats = Counter()
+
+class ScheduledModel:
+    # Stands in for a GenerativeModel: same model_name, generate_content goes through the scheduler.
+    def __init__(self, scheduler, lane, model):
+        self.scheduler = scheduler; self.lane = lane; self.model = model; self.model_name = model.model_name
+    def generate_content(self, contents, stream=False, **kwargs):
+        return self.scheduler.generate(self.lane, self.model, contents, stream, **kwargs)
+
+class GeminiScheduler:
+    def __init__(self, genai, rpm=None, tpm=None, attempts=5, base_delay=1.0, max_delay=60.0):
+        # rpm/tpm override DEFAULT_LIMITS for every model. `share` divides the limits between
+        # processes that use the same key (batch workers).
+        self.genai = genai; self.rpm = rpm; self.tpm = tpm; self.share = 1
+        self.attempts = attempts; self.base_delay = base_delay; self.max_delay = max_delay
+        self.cond = threading.Condition(); self.lanes = {}; self.models = {}; self.clients = {}
+
+    def client(self, api_key, service):
+        # The SDK's own client manager, configured for this key only ("generative", "file").
+        with self.cond:
+            if api_key not in self.clients:
+                self.clients[api_key] = importlib.import_module(f"{self.genai.__name__}.client")._ClientManager()
+                self.clients[api_key].configure(api_key=api_key)
+            return self.clients[api_key].get_default_client(service)
+
+    def model(self, api_key, model_name):
+        with self.cond:
+            key = (api_key, model_name)
+            if key not in self.lanes:
+                rpm, tpm = DEFAULT_LIMITS.get(model_name, FALLBACK_LIMITS)
+                self.lanes[key] = Lane(max(1, (self.rpm or rpm) // self.share), max(1, (self.tpm or tpm) // self.share))
+            if key not in self.models:
+                model = self.genai.GenerativeModel(model_name=model_name)
+                model._client = self.client(api_key, "generative")  # otherwise taken from genai.configure on the first call
+                self.models[key] = model
+            return ScheduledModel(self, self.lanes[key], self.models[key])
+
+    def upload_file(self, api_key, path):
+        # Returns the File record; media parts accept it as it is.
+        return self.client(api_key, "file").create_file(path=path, mime_type=mimetypes.guess_type(path)[0], display_name=os.path.basename(path))
+
+    def get_file(self, api_key, name): return self.client(api_key, "file").get_file(name=name)
+
+    def admit(self, lane, session, tokens):
+        # Blocks until this ticket is first in its session's queue, its session has the turn and
+        # both buckets can pay.
+        started = time.monotonic(); ticket = object(); admitted = False
+        with self.cond:
+            lane.queues.setdefault(session, deque()).append(ticket)
+            if session not in lane.turns: lane.turns.append(session)
+            try:
+                while True:
+                    if lane.turns[0] == session and lane.queues[session][0] is ticket:
+                        delay = max(lane.requests.delay(1), lane.tokens.delay(tokens), lane.paused_until - time.monotonic())
+                        if delay <= 0: break
+                        self.cond.wait(delay)
+                    else: self.cond.wait()
+                lane.requests.take(1); lane.tokens.take(tokens); admitted = True
+                lane.stats["calls"] += 1; lane.stats["wait_s"] += time.monotonic() - started
+            finally:
+                lane.queues[session].remove(ticket)
+                if not lane.queues[session]: del lane.queues[session]; lane.turns.remove(session)
+                elif admitted: lane.turns.rotate(-1)  # back of the line until the other sessions had a go
+                self.cond.notify_all()
+
+    def settle(self, lane, estimate, actual):
+        with self.cond: lane.tokens.take(actual - estimate); self.cond.notify_all()
+
+    def pause(self, lane, seconds):
+        with self.cond:
+            lane.paused_until = max(lane.paused_until, time.monotonic() + seconds); lane.stats["rate_limited"] += 1
+            self.cond.notify_all()
+
+    def generate(self, lane, model, contents, stream=False, session=None, **kwargs):
+        session = session or SESSION.get()
+        estimate = estimate_tokens(contents)
+        for attempt in range(self.attempts):
+            self.admit(lane, session, estimate)
+            try: response = model.generate_content(contents, stream=stream, **kwargs)
+            except Exception as e:
+                self.settle(lane, estimate, 0)  # the request is spent, the tokens were not
+                code = status_code(e)
+                if code not in RETRY_CODES: raise
+                if attempt == self.attempts - 1:
+                    raise GeminiUnavailable(f"Gemini is {'rate limiting this API key' if code == 429 else 'unavailable'} (gave up after {self.attempts} tries): {e}") from e
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                with self.cond: lane.stats["retries"] += 1
+                # A 429 holds every caller on the lane, for at least as long as the server asked.
+                if code == 429: self.pause(lane, max(retry_hint(e), delay))
+                else: time.sleep(delay)
+                continue
+            if not stream: self.settle(lane, estimate, prompt_tokens(response) or estimate); return response
+            return self.settled_stream(lane, estimate, response)
+
+    def settled_stream(self, lane, estimate, chunks):
+        actual = 0
+        try:
+            for chunk in chunks: actual = prompt_tokens(chunk) or actual; yield chunk
+        finally: self.settle(lane, estimate, actual or estimate)
+
+    def snapshot(self):
+        # Per-lane state for the admin panel; keys are shown by their last four characters.
+        with self.cond:
+            rows = []
+            for (api_key, model_name), lane in self.lanes.items():
+                lane.requests.refill(); lane.tokens.refill()
+                rows.append({"key": f"…{api_key[-4:]}", "model": model_name, "waiting": sum(map(len, lane.queues.values())), "sessions": len(lane.turns),
+                             "requests left": int(lane.requests.level), "tokens left": int(lane.tokens.level),
+                             "paused s": round(max(0.0, lane.paused_until - time.monotonic()), 1), **{k: round(v, 2) for k, v in lane.stats.items()}})
+            return rows
@@ -0,0 +1,84 @@
+# Media probing that never decodes a frame: duration, codecs, bitrate and video keyframe
+# times in one call. Uses ffprobe when it is installed and otherwise parses a single
+# stream-copy pass of ffmpeg (the imageio-ffmpeg bundle ships ffmpeg only). Results are cached
+# per file in this process; Streamlit reruns re-execute app.py but keep imported modules.
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+
+PROBE_CACHE_SIZE = 64
+probe_cache = OrderedDict()
+probe_cache_lock = threading.Lock()
+
+class ProbeError(RuntimeError): pass
+
+def find_ffprobe(ffmpeg):
+    sibling = os.path.join(os.path.dirname(ffmpeg), "ffprobe" + (".exe" if ffmpeg.lower().endswith(".exe") else ""))
+    return shutil.which("ffprobe") or (sibling if os.path.isfile(sibling) else None)
+
+def run(cmd):
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+
+def last_line(text): return (text.strip().splitlines() or ["no output"])[-1]
+
+def probe_with_ffprobe(ffprobe, path):
+    result = run([ffprobe, "-v", "error", "-of", "json", "-show_format", "-show_streams", path])
+    if result.returncode != 0: raise ProbeError(last_line(result.stderr))
+    info = json.loads(result.stdout or "{}"); fmt = info.get("format", {})
+    streams = info.get("streams", [])
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    # Cover art in an mp3/m4a shows up as a one-frame video stream; it is still audio.
+    video = next((s for s in streams if s.get("codec_type") == "video" and not s.get("disposition", {}).get("attached_pic")), None)
+    keyframes = []
+    if video is not None:
+        packets = run([ffprobe, "-v", "error", "-select_streams", str(video["index"]), "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path])
+        for line in packets.stdout.splitlines():
+            pts, _, flags = line.partition(",")
+            if "K" in flags and pts not in ("", "N/A"): keyframes.append(float(pts))
+    return {"duration": float(fmt.get("duration") or 0), "bit_rate": int(fmt.get("bit_rate") or 0),
+            "audio_codec": audio and audio.get("codec_name"), "video_codec": video and video.get("codec_name"), "keyframes": sorted(keyframes)}
+
+def probe_with_ffmpeg(ffmpeg, path):
+    # `ffmpeg -i` prints the container header; copying the first video stream into framecrc
+    # lists every packet without decoding, and only keyframes lack an "F=" flags column.
+    result = run([ffmpeg, "-hide_banner", "-nostats", "-i", path, "-map", "0:v:0?", "-c", "copy", "-f", "framecrc", "-"])
+    header = result.stderr
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", header)
+    if not duration: raise ProbeError(last_line(header))
+    bit_rate = re.search(r"bitrate: (\d+) kb/s", header)
+    streams = re.findall(r"Stream #\d+:\d+.*?: (Audio|Video): (\w+)(.*)", header)
+    audio = next((codec for kind, codec, _ in streams if kind == "Audio"), None)
+    video = next((codec for kind, codec, rest in streams if kind == "Video" and "(attached pic)" not in rest), None)
+    keyframes = []
+    if video is not None:
+        time_base = re.search(r"#tb 0: (\d+)/(\d+)", result.stdout)
+        scale = int(time_base.group(1)) / int(time_base.group(2)) if time_base else 0
+        for line in result.stdout.splitlines():
+            if line.startswith("#"): continue
+            fields = [f.strip() for f in line.split(",")]
+            if len(fields) >= 6 and (len(fields) == 6 or int(fields[6][2:], 16) & 1): keyframes.append(int(fields[2]) * scale)
+    hours, minutes, seconds = duration.groups()
+    return {"duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds), "bit_rate": int(bit_rate.group(1)) * 1000 if bit_rate else 0,
+            "audio_codec": audio, "video_codec": video, "keyframes": sorted(keyframes)}
+
+def probe(path, ffmpeg="ffmpeg", file_hash=None):
+    # Returns {"duration", "bit_rate", "size", "audio_codec", "video_codec", "keyframes"}; the
+    # dict is shared through the cache, so callers must not modify it. Raises ProbeError with
+    # ffmpeg's reason when the file cannot be read.
+    stat = os.stat(path)
+    key = file_hash or (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with probe_cache_lock:
+        if key in probe_cache: probe_cache.move_to_end(key); return probe_cache[key]
+    ffprobe = find_ffprobe(ffmpeg)
+    info = probe_with_ffprobe(ffprobe, path) if ffprobe else probe_with_ffmpeg(ffmpeg, path)
+    if info["duration"] <= 0: raise ProbeError("the file has no duration")
+    info["size"] = stat.st_size
+    if not info["bit_rate"]: info["bit_rate"] = int(stat.st_size * 8 / info["duration"])
+    with probe_cache_lock:
+        probe_cache[key] = info
+        while len(probe_cache) > PROBE_CACHE_SIZE: probe_cache.popitem(last=False)
+    return info
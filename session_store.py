@@ -0,0 +1,134 @@
+# SQLite store for what a user session produces: the notes (kept as #/## sections, so a page of
+# them can be read without the rest), chat history, quiz and mind map. It survives server
+# restarts, and the Streamlit session itself only holds its id. Streamlit runs every rerun in a
+# fresh thread, so one connection is shared by all of them behind a lock.
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, touched REAL NOT NULL, notes_hash TEXT, lean_savings TEXT);
+CREATE TABLE IF NOT EXISTS sections (session TEXT NOT NULL, idx INTEGER NOT NULL, level INTEGER NOT NULL, title TEXT NOT NULL, body TEXT NOT NULL,
+                                     PRIMARY KEY (session, idx)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session, id);
+CREATE TABLE IF NOT EXISTS artifacts (session TEXT NOT NULL, kind TEXT NOT NULL, notes_hash TEXT NOT NULL, value TEXT NOT NULL,
+                                      PRIMARY KEY (session, kind)) WITHOUT ROWID;
+"""
+SESSION_TABLES = ("sections", "messages", "artifacts")
+PRUNE_EVERY_SEC = 3600
+
+def split_sections(markdown_text):
+    sections, current = [], []
+    for line in markdown_text.split('\n'):
+        if re.match(r'#{1,2} ', line) and any(l.strip() for l in current): sections.append('\n'.join(current).strip()); current = []
+        current.append(line)
+    if any(l.strip() for l in current): sections.append('\n'.join(current).strip())
+    return sections
+
+def section_title(section):
+    first = section.split("\n", 1)[0]
+    heading = re.match(r"(#{1,6}) +(.*)", first)
+    if heading: return len(heading.group(1)), heading.group(2).strip()
+    return 0, first[:60].strip() or "Notes"
+
+def digest(text): return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class SessionStore:
+    def __init__(self, path, ttl_days=30, keep_messages=200):
+        self.path = path; self.ttl_days = ttl_days; self.keep_messages = keep_messages; self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL"); self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.prune()
+
+    def write(self, statements):
+        # [(sql, params)] in one transaction.
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements: self.conn.execute(sql, params)
+                self.conn.execute("COMMIT")
+            except BaseException: self.conn.execute("ROLLBACK"); raise
+
+    def all(self, sql, params=()):
+        with self.lock: return self.conn.execute(sql, params).fetchall()
+
+    def one(self, sql, params=()):
+        with self.lock: return self.conn.execute(sql, params).fetchone()
+
+    # --- sessions ---
+    def exists(self, session): return self.one("SELECT 1 FROM sessions WHERE id = ?", (session,)) is not None
+
+    def touch(self, session):
+        # The store lives as long as the server, so expired sessions are swept from here as well.
+        if time.time() - self.pruned > PRUNE_EVERY_SEC: self.prune()
+        self.write([("INSERT INTO sessions (id, touched) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET touched = excluded.touched", (session, time.time()))])
+
+    def delete(self, session):
+        self.write([(f"DELETE FROM {table} WHERE session = ?", (session,)) for table in SESSION_TABLES] + [("DELETE FROM sessions WHERE id = ?", (session,))])
+
+    def prune(self):
+        # Sessions nobody opened for ttl_days are dropped with everything they hold.
+        self.pruned = time.time(); cutoff = self.pruned - self.ttl_days * 86400
+        stale = "SELECT id FROM sessions WHERE touched < ?"
+        self.write([(f"DELETE FROM {table} WHERE session IN ({stale})", (cutoff,)) for table in SESSION_TABLES] + [("DELETE FROM sessions WHERE touched < ?", (cutoff,))])
+
+    def lean_savings(self, session):
+        row = self.one("SELECT lean_savings FROM sessions WHERE id = ?", (session,))
+        return tuple(json.loads(row[0])) if row and row[0] else None
+
+    # --- notes ---
+    def notes_hash(self, session):
+        row = self.one("SELECT notes_hash FROM sessions WHERE id = ?", (session,))
+        return row[0] if row else None
+
+    def notes(self, session): return "\n\n".join(body for (body,) in self.all("SELECT body FROM sections WHERE session = ? ORDER BY idx", (session,)))
+
+    def set_notes(self, session, notes, append=False, lean_savings=None):
+        # Replaces the notes, or adds sections after them; the hash always covers the stored text.
+        # New notes replace the lean savings too ((original, lean) bytes, or None if not lean).
+        sections = split_sections(notes)
+        with self.lock:
+            before = self.notes(session) if append else ""
+            start = self.one("SELECT COALESCE(MAX(idx) + 1, 0) FROM sections WHERE session = ?", (session,))[0] if append else 0
+            full = "\n\n".join(part for part in (before, *sections) if part)
+            self.touch(session)
+            self.write(([] if append else [("DELETE FROM sections WHERE session = ?", (session,))])
+                       + [("INSERT INTO sections (session, idx, level, title, body) VALUES (?, ?, ?, ?, ?)", (session, start + i, *section_title(section), section))
+                          for i, section in enumerate(sections)]
+                       + [("UPDATE sessions SET notes_hash = ? WHERE id = ?", (digest(full) if full else None, session))]
+                       + ([] if append else [("UPDATE sessions SET lean_savings = ? WHERE id = ?", (lean_savings and json.dumps(list(lean_savings)), session))]))
+
+    def toc(self, session): return self.all("SELECT idx, level, title FROM sections WHERE session = ? ORDER BY idx", (session,))
+
+    def sections(self, session, start, stop):
+        return [body for (body,) in self.all("SELECT body FROM sections WHERE session = ? AND idx >= ? AND idx < ? ORDER BY idx", (session, start, stop))]
+
+    # --- chat ---
+    def add_message(self, session, role, content):
+        # Only the newest keep_messages are kept per session.
+        self.touch(session)
+        self.write([("INSERT INTO messages (session, role, content) VALUES (?, ?, ?)", (session, role, content)),
+                    ("DELETE FROM messages WHERE session = ? AND id <= (SELECT id FROM messages WHERE session = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                     (session, session, self.keep_messages))])
+
+    def messages(self, session, limit):
+        rows = self.all("SELECT role, content FROM messages WHERE session = ? ORDER BY id DESC LIMIT ?", (session, limit))
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def message_count(self, session): return self.one("SELECT COUNT(*) FROM messages WHERE session = ?", (session,))[0]
+
+    # --- quiz / mind map ---
+    def artifact(self, session, kind, notes_hash):
+        row = self.one("SELECT value FROM artifacts WHERE session = ? AND kind = ? AND notes_hash = ?", (session, kind, notes_hash))
+        return json.loads(row[0]) if row else None
+
+    def put_artifact(self, session, kind, notes_hash, value):
+        self.touch(session)
+        self.write([("INSERT OR REPLACE INTO artifacts (session, kind, notes_hash, value) VALUES (?, ?, ?, ?)", (session, kind, notes_hash, json.dumps(value)))])
@@ -0,0 +1,62 @@
+# GeminiScheduler against benchmarks/fake_genai: retries, giving up, and turn-taking between sessions.
+#   python -m pytest -q tests
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import fake_genai
+from gemini_client import GeminiScheduler, GeminiUnavailable
+
+@pytest.fixture(autouse=True)
+def fake(monkeypatch):
+    monkeypatch.setattr(fake_genai, "TIME_SCALE", 0.0)
+    fake_genai.failures.clear(); fake_genai.calls.clear()
+    yield fake_genai
+    fake_genai.failures.clear()
+
+def scheduled(attempts=3, rpm=None):
+    scheduler = GeminiScheduler(fake_genai, rpm=rpm, attempts=attempts, base_delay=0.01, max_delay=0.01)
+    return scheduler.model("key", "gemini-2.5-flash")
+
+def test_429_pauses_the_lane_and_retries():
+    model = scheduled()
+    fake_genai.failures.append(fake_genai.APIError(429, "Resource exhausted. Please retry in 0.2s."))
+    started = time.monotonic()
+    assert model.generate_content("Summarise the lecture.").text
+    assert time.monotonic() - started >= 0.2  # held for the server's hint, not the 0.01s backoff
+    assert fake_genai.calls["generate"] == 2
+    assert model.lane.stats["rate_limited"] == 1 and model.lane.stats["retries"] == 1
+
+def test_gives_up_after_the_last_attempt():
+    model = scheduled(attempts=3)
+    fake_genai.failures.extend(fake_genai.APIError(503, "Service unavailable.") for _ in range(3))
+    with pytest.raises(GeminiUnavailable, match="gave up after 3 tries"): model.generate_content("Summarise the lecture.")
+    assert fake_genai.calls["generate"] == 3 and model.lane.stats["retries"] == 2
+
+def test_other_errors_are_not_retried():
+    model = scheduled()
+    fake_genai.failures.append(fake_genai.APIError(400, "Invalid argument."))
+    with pytest.raises(fake_genai.APIError): model.generate_content("Summarise the lecture.")
+    assert fake_genai.calls["generate"] == 1 and not model.lane.stats["retries"]
+
+def test_sessions_take_turns():
+    # An empty request bucket at 600 rpm admits one call every 0.1s, so the finishing order is the
+    # admission order. Session A queues all its calls before B queues any.
+    model = scheduled(rpm=600); model.lane.requests.level = 0.0
+    order = []; lock = threading.Lock()
+    def call(session):
+        model.generate_content("Summarise the lecture.", session=session)
+        with lock: order.append(session)
+    threads = []
+    for session in "AB":
+        for _ in range(3):
+            threads.append(threading.Thread(target=call, args=(session,))); threads[-1].start()
+        while len(model.lane.queues.get(session, ())) < 3: time.sleep(0.005)
+    for thread in threads: thread.join()
+    assert "".join(order) == "ABABAB"